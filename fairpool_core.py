@@ -0,0 +1,1834 @@
+# Copyright © 2026 FairPool v/Tommy Christensen, Laur Larsensgade 13, STTH, 4800 Nykøbing F.
+# E-mail: info@fairpool.dk
+# Denne app og dens underliggende kode/koncept er udviklet af FairPool v/Tommy Christensen.
+# Alle rettigheder forbeholdes FairPool v/Tommy Christensen.
+# Service Teknikere ansat hos Sol og Strand har tilladelse til at bruge appen uden beregning i forbindelse med deres arbejde.
+# Må ikke kopieres, distribueres, modificeres, sælges eller på anden måde anvendes kommercielt eller deles offentligt
+# uden skriftlig tilladelse fra FairPool v/Tommy Christensen.
+
+"""Kataloger, historik, dosering, prognose, rute, health og sessioner – alt i FairPool uden for siderne.
+
+pool_app.py (Streamlit-scriptet) og serve.py importerer begge dette modul. Streamlits cache-nøgler bygger
+på modul, navn og kildekode, så de baggrundsjob serve.py starter ved processtart er de samme som scriptet
+ser – og scriptets egne start_*-kald er gratis.
+"""
+
+import fcntl
+import io
+import json
+import logging
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+import time
+import tracemalloc
+import zipfile
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+from streamlit.runtime import Runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+import gspread
+from oauth2client.service_account import ServiceAccountCredentials
+
+logger = logging.getLogger(__name__)
+
+# ────────────────────────────────────────────────
+# Google Sheets opsætning
+# ────────────────────────────────────────────────
+POOL_SHEET_ID = "1J7hqPcK7rpRwrjaYAhKh5jDpk8tNYKhfM3_7FWCY2rA"
+POOL_WORKSHEET_NAME = "Sheet1"
+
+SPA_SHEET_ID = "16PLyJjec6WX-6Z5SQD1B_tl8qZYObKRx5Nt9ZRBHgRU"
+SPA_WORKSHEET_NAME = "Sheet1"
+
+# Kataloger kan deles op i områder (region/firma/kunde) – ét sheet eller én fane pr. område.
+# Uden opsætning er der ét område med sheetene ovenfor. Eksempel i secrets:
+#   [[shards]]
+#   name = "Lolland-Falster"
+#   pool_sheet_id = "..."          # standard: POOL_SHEET_ID
+#   pool_worksheet = "Lolland"     # tom streng = ingen pools i området
+#   spa_sheet_id = "..."           # standard: SPA_SHEET_ID
+#   spa_worksheet = "Lolland"      # tom streng = ingen SPA'er i området
+#   ttl = 300                      # sekunder mellem hentninger af området
+#   emails = ["tekniker@firma.dk"] # teknikere der servicerer området
+#   domains = ["sologstrand.dk"]
+#   default = false                # true: teknikere uden tilknytning får dette område
+#   prewarm = false                # true: hentes ved opstart (standardområder forvarmes altid)
+# Teknikere der hverken er nævnt i emails/domains eller har et standardområde, ser ingen kataloger.
+DEFAULT_SHARD_TTL = 300
+
+# Målinger fra besøg gemmes i en ekstra fane i pool-sheetet (bruges til prognoser).
+# Med flere replikaer bør fanen ligge i sit eget regneark, så målinger ikke får kataloget til at se ændret ud:
+#   [history]
+#   sheet_id = "..."
+HISTORY_SHEET_ID = st.secrets.get("history", {}).get("sheet_id", POOL_SHEET_ID)
+HISTORY_WORKSHEET_NAME = "Målinger"
+HISTORY_HEADERS = ["Dato", "Type", "Objekt", "pH", "Klor", "Udlejet", "Sticks"]
+
+scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
+
+@st.cache_resource
+def get_sheets_client():
+    creds = ServiceAccountCredentials.from_json_keyfile_dict(st.secrets["gcp_service_account"], scope)
+    return gspread.authorize(creds)
+
+@st.cache_resource
+def get_spreadsheet(sheet_id):
+    return get_sheets_client().open_by_key(sheet_id)
+
+@st.cache_resource
+def get_worksheet(sheet_id, worksheet_name):
+    return get_spreadsheet(sheet_id).worksheet(worksheet_name)
+
+def spreadsheet_modified_time(sheet_id):
+    """Drive's ændringstidspunkt for et regneark – et billigt metadata-kald i stedet for en fuld download."""
+    return get_spreadsheet(sheet_id).get_lastUpdateTime()
+
+def catalog_shards():
+    configured = st.secrets.get("shards")
+    if not configured:
+        configured = [{"name": "Alle", "pool_worksheet": POOL_WORKSHEET_NAME, "spa_worksheet": SPA_WORKSHEET_NAME,
+                       "default": True}]
+    shards = []
+    for shard in configured:
+        shard = dict(shard)
+        shards.append({
+            "name": shard["name"],
+            "pool_sheet_id": shard.get("pool_sheet_id", POOL_SHEET_ID),
+            "pool_worksheet": shard.get("pool_worksheet", POOL_WORKSHEET_NAME),
+            "spa_sheet_id": shard.get("spa_sheet_id", SPA_SHEET_ID),
+            "spa_worksheet": shard.get("spa_worksheet", SPA_WORKSHEET_NAME),
+            "ttl": float(shard.get("ttl", DEFAULT_SHARD_TTL)),
+            "emails": [e.strip().lower() for e in shard.get("emails", [])],
+            "domains": [d.strip().lower() for d in shard.get("domains", [])],
+            "default": bool(shard.get("default", False)),
+            "prewarm": bool(shard.get("prewarm", False) or shard.get("default", False)),
+        })
+    return shards
+
+def shards_for_email(email):
+    """Områder for en tekniker. Uden tilknytning: standardområderne (kan være ingen)."""
+    email = (email or "").strip().lower()
+    domain = email.rpartition("@")[2]
+    shards = catalog_shards()
+    mine = [s for s in shards if email in s["emails"] or (domain and domain in s["domains"])]
+    return mine or [s for s in shards if s["default"]]
+
+def get_shard_sheet(shard, kind):
+    if kind == "pools":
+        return get_worksheet(shard["pool_sheet_id"], shard["pool_worksheet"])
+    return get_worksheet(shard["spa_sheet_id"], shard["spa_worksheet"])
+
+def shard_has(shard, kind):
+    return bool(shard["pool_worksheet"] if kind == "pools" else shard["spa_worksheet"])
+
+@st.cache_resource
+def get_history_sheet(create=False):
+    """Historik-fanen, eller None hvis den ikke findes. Fanen oprettes kun ved skrivning (create=True)."""
+    spreadsheet = get_sheets_client().open_by_key(HISTORY_SHEET_ID)
+    try:
+        return spreadsheet.worksheet(HISTORY_WORKSHEET_NAME)
+    except gspread.WorksheetNotFound:
+        if not create:
+            return None
+        sheet = spreadsheet.add_worksheet(HISTORY_WORKSHEET_NAME, rows=1000, cols=len(HISTORY_HEADERS))
+        sheet.append_row(HISTORY_HEADERS)
+        return sheet
+
+# ────────────────────────────────────────────────
+# Load funktioner
+# ────────────────────────────────────────────────
+def parse_pools(values):
+    if not values:
+        return {}, {}
+ 
+    headers = [h.strip() for h in values[0]] if values else []
+ 
+    pools = {}
+    pool_info = {}
+ 
+    for row in values[1:]:
+        if not row or not row[0].strip(): continue
+     
+        name = row[0].strip()
+        if not name or name.startswith("-"): continue
+     
+        vol_idx = headers.index("Volumen (m3)") if "Volumen (m3)" in headers else 1
+        vol_str = row[vol_idx] if vol_idx < len(row) else "0"
+        try:
+            vol = float(vol_str.replace(",", "."))
+        except (ValueError, TypeError):
+            vol = 0.0
+     
+        pools[name] = vol
+     
+        extra = {}
+        adresse_idx = headers.index("Adresse") if "Adresse" in headers else 2
+        pumpetype_idx = headers.index("Pumpetype") if "Pumpetype" in headers else 3
+        returskyl_idx = headers.index("Returskyl (5 min)") if "Returskyl (5 min)" in headers else 4
+        nøglebokskode_idx = headers.index("Nøglebokskode") if "Nøglebokskode" in headers else 5
+        he_idx = headers.index("HE telefonnummer") if "HE telefonnummer" in headers else 6
+        instruktioner_idx = headers.index("Instruktioner") if "Instruktioner" in headers else None
+     
+        if adresse_idx < len(row): extra["Adresse"] = row[adresse_idx] or "Ikke angivet"
+        if pumpetype_idx < len(row): extra["Pumpetype"] = row[pumpetype_idx] or "Ikke angivet"
+        if returskyl_idx < len(row) and row[returskyl_idx]:
+            try:
+                liter = float(row[returskyl_idx])
+                kubik = liter / 1000
+                extra["Returskyl (5 min)"] = f"{int(liter)} liter / {kubik:.1f} m³"
+            except (ValueError):
+                extra["Returskyl (5 min)"] = row[returskyl_idx]
+        else:
+            extra["Returskyl (5 min)"] = "Ikke angivet"
+        if nøglebokskode_idx < len(row): extra["Nøglebokskode"] = row[nøglebokskode_idx] or "Ikke angivet"
+        if he_idx < len(row): extra["HE telefonnummer"] = row[he_idx] or "Ikke angivet"
+        if instruktioner_idx is not None and instruktioner_idx < len(row):
+            extra["Instruktioner"] = row[instruktioner_idx] or ""
+     
+        pool_info[name] = extra
+ 
+    return pools, pool_info
+
+
+# SPA-sheetets kolonner og hvordan hver celle normaliseres ved indlæsning.
+# Manglende værdier bliver None; ugyldige værdier bliver None og kommer med i fejlrapporten.
+SPA_SCHEMA = {
+    "ObjektNummer":  "text",
+    "Adresse":       "text",
+    "Model":         "text",
+    "NøgleKode":     "text",
+    "Styresystem":   "text",
+    "Liter":         "liter",
+    "Fyldning":      "minutes",
+    "Fyldes":        "fyldes",
+    "Fyldetid":      "minutes",
+    "Tømning":       "tomning",
+    "Link":          "url",
+    "Billede":       "images",
+    "Instruktioner": "text",
+}
+MISSING_VALUES = ("", "ikke angivet", "—", "-")
+
+# Fyldes/Tømning klassificeres én gang til en fast type → (ikon, baggrundsfarve)
+SPA_FYLDES_STYLE = {
+    "automatisk": ("🤖", "#f0fff4"),
+    "semi":       ("🔧", "#fff8f0"),
+    "vandslange": ("🪣", "#f0f7ff"),
+    "andet":      ("💧", "#f0f7ff"),
+}
+SPA_TOMNING_STYLE = {
+    "automatisk": ("🤖", "#f0fff4"),
+    "semi":       ("🔧", "#fff8f0"),
+    "manuel":     ("🪣", "#fff0f0"),
+    "ingen":      ("🚫", "#f5f5f5"),
+    "andet":      ("🔽", "#f9f9f9"),
+}
+
+
+def classify_fyldes(text):
+    lower = text.lower()
+    if "automatisk" in lower:
+        return "automatisk"
+    if "kuglehane" in lower or "semi" in lower:
+        return "semi"
+    if "vandslange" in lower:
+        return "vandslange"
+    return "andet"
+
+
+def classify_tomning(text):
+    lower = text.lower()
+    if "automatisk" in lower:
+        return "automatisk"
+    if "kuglehane" in lower or "semi" in lower:
+        return "semi"
+    if "dykpumpe" in lower or "manuel" in lower:
+        return "manuel"
+    if "ikke" in lower:
+        return "ingen"
+    return "andet"
+
+
+def _normalize_spa_cell(kind, raw):
+    """(værdi, problem) for én celle ud fra dens type i SPA_SCHEMA."""
+    text = str(raw).strip()
+    if text.lower() in MISSING_VALUES:
+        return None, None
+
+    if kind == "liter":
+        number = re.sub(r"\s*(l|liter)\.?$", "", text, flags=re.IGNORECASE)
+        if re.fullmatch(r"\d{1,3}(\.\d{3})+(,\d+)?", number):
+            number = number.replace(".", "")   # dansk tusindtalsseparator, fx 1.200
+        number = number.replace(",", ".")
+        try:
+            return float(number), None
+        except ValueError:
+            return None, "ikke et antal liter"
+    if kind == "minutes":
+        number = re.sub(r"\s*(min\.?|minutter)\s*$", "", text, flags=re.IGNORECASE).replace(",", ".")
+        try:
+            return float(number), None
+        except ValueError:
+            # Fritekst som "20-30 min" vises som den står, men kommer med i fejlrapporten
+            return text, "ikke et antal minutter"
+    if kind == "images":
+        return [b.strip() for b in re.split(r"[,\n]+", text) if b.strip()], None
+    if kind == "url" and not text.lower().startswith(("http://", "https://")):
+        return text, "link starter ikke med http(s)://"
+    return text, None
+
+
+def parse_spas(values):
+    """Kolonneopdelt SPA-katalog: typede kolonner, visningsnavne, opslag og fejlrapport."""
+    spas = {"columns": {}, "display_name": [], "index": {}, "problems": []}
+    if not values:
+        return spas
+
+    headers = [h.strip() for h in values[0]]
+    extra_headers = [h for h in headers if h and h not in SPA_SCHEMA]
+    schema = {**SPA_SCHEMA, **{h: "text" for h in extra_headers}}
+    columns = {name: [] for name in schema}
+    columns["Fyldes_type"] = []
+    columns["Tømning_type"] = []
+    positions = {h: i for i, h in reversed(list(enumerate(headers)))}
+
+    for row_no, row in enumerate(values[1:], start=2):
+        if not row or not row[0].strip():
+            continue
+
+        record = {}
+        for name, kind in schema.items():
+            i = positions.get(name)
+            raw = row[i] if i is not None and i < len(row) else ""
+            value, problem = _normalize_spa_cell(kind, raw)
+            if problem:
+                spas["problems"].append({"Række": row_no, "Kolonne": name, "Værdi": raw, "Problem": problem})
+            record[name] = value
+
+        display_name = f"{record['ObjektNummer'] or ''} - {record['Adresse'] or ''}".strip(" -")
+        if not display_name:
+            spas["problems"].append({"Række": row_no, "Kolonne": "ObjektNummer", "Værdi": row[0],
+                                     "Problem": "mangler både ObjektNummer og Adresse"})
+            continue
+
+        for name in schema:
+            columns[name].append(record[name])
+        columns["Fyldes_type"].append(classify_fyldes(record["Fyldes"]) if record["Fyldes"] else None)
+        columns["Tømning_type"].append(classify_tomning(record["Tømning"]) if record["Tømning"] else None)
+        spas["index"].setdefault(display_name, len(spas["display_name"]))
+        spas["display_name"].append(display_name)
+
+    spas["columns"] = columns
+    return spas
+
+
+def spa_record(spas, i):
+    record = {name: values[i] for name, values in spas["columns"].items()}
+    record["display_name"] = spas["display_name"][i]
+    return record
+
+
+def parse_catalog(kind, values):
+    return parse_pools(values) if kind == "pools" else parse_spas(values)
+
+
+def catalog_size(kind, catalog):
+    return len(catalog[0]) if kind == "pools" else len(catalog["display_name"])
+
+
+@st.cache_resource
+def _shard_cache():
+    # (område, type) → (hentet, katalog). Deles af alle sessioner i processen – ingen kopier pr. session
+    return {"entries": {}, "locks": {}, "lock": threading.Lock()}
+
+
+def fetch_shard_catalog(shard, kind):
+    """Ét områdes pools eller SPA'er fra Sheets, cachet med områdets egen TTL."""
+    cache = _shard_cache()
+    key = (shard["name"], kind)
+    with cache["lock"]:
+        key_lock = cache["locks"].setdefault(key, threading.Lock())
+    with key_lock:
+        catalog = _fresh_cache_entry(shard, kind)
+        if catalog is not None:
+            return catalog
+        started = time.perf_counter()
+        try:
+            values = get_shard_sheet(shard, kind).get_all_values() if shard_has(shard, kind) else []
+        except Exception as exc:
+            record_catalog_error(f"{shard['name']}/{kind}", exc)
+            raise
+        catalog = parse_catalog(kind, values)
+        cache["entries"][key] = (time.time(), catalog)
+        record_catalog_fetch(f"{shard['name']}/{kind}", catalog_size(kind, catalog),
+                             time.perf_counter() - started, "sheets")
+        publish_catalog(shard["name"], kind, catalog)
+        return catalog
+
+
+def _fresh_cache_entry(shard, kind):
+    entry = _shard_cache()["entries"].get((shard["name"], kind))
+    return entry[1] if entry and time.time() - entry[0] < shard["ttl"] else None
+
+
+def cached_shard_kinds():
+    """(område, type) der aktuelt er i processens cache, dvs. bliver brugt af nogen."""
+    cache = _shard_cache()
+    with cache["lock"]:
+        return set(cache["entries"])
+
+
+def invalidate_shard(shard, kind=None):
+    cache = _shard_cache()
+    with cache["lock"]:
+        for k in (kind,) if kind else ("pools", "spas"):
+            cache["entries"].pop((shard["name"], k), None)
+
+
+def cached_shard_catalog(shard, kind):
+    """Områdets katalog fra snapshot eller processens cache uden kald til Sheets, ellers None."""
+    snapshot = snapshot_catalog(shard["name"], kind)
+    if snapshot is None:
+        return _fresh_cache_entry(shard, kind)
+    # Efter en lokal skrivning er processens egen hentning nyere, indtil refresheren har skrevet snapshottet om
+    entry = _shard_cache()["entries"].get((shard["name"], kind))
+    return entry[1] if entry and entry[0] > snapshot[0] else snapshot[1]
+
+
+def load_shard_catalog(shard, kind):
+    catalog = cached_shard_catalog(shard, kind)
+    return catalog if catalog is not None else fetch_shard_catalog(shard, kind)
+
+
+def load_shard_catalogs(shards, kind):
+    """Kun de områder teknikeren servicerer – cachede direkte, udløbne hentes parallelt."""
+    catalogs = [cached_shard_catalog(shard, kind) for shard in shards]
+    expired = [i for i, catalog in enumerate(catalogs) if catalog is None]
+    if len(expired) == 1:
+        catalogs[expired[0]] = fetch_shard_catalog(shards[expired[0]], kind)
+    elif expired:
+        with ThreadPoolExecutor(max_workers=min(8, len(expired)), thread_name_prefix="shard") as executor:
+            for i, catalog in zip(expired, executor.map(lambda i: fetch_shard_catalog(shards[i], kind), expired)):
+                catalogs[i] = catalog
+    return catalogs
+
+
+def merge_spa_catalogs(shards, parts):
+    if len(parts) == 1:
+        return parts[0]
+    names = list(dict.fromkeys(name for part in parts for name in part["columns"]))
+    merged = {"columns": {name: [] for name in names}, "display_name": [], "index": {}, "problems": []}
+    for shard, part in zip(shards, parts):
+        size = len(part["display_name"])
+        for name in names:
+            merged["columns"][name].extend(part["columns"].get(name, [None] * size))
+        for display_name in part["display_name"]:
+            merged["index"].setdefault(display_name, len(merged["display_name"]))
+            merged["display_name"].append(display_name)
+        merged["problems"].extend({"Område": shard["name"], **problem} for problem in part["problems"])
+    return merged
+
+
+def load_pools(shards=None):
+    pools, pool_info = {}, {}
+    for part_pools, part_info in load_shard_catalogs(catalog_shards() if shards is None else shards, "pools"):
+        pools.update(part_pools)
+        pool_info.update(part_info)
+    return pools, pool_info
+
+
+def load_spas(shards=None):
+    shards = catalog_shards() if shards is None else shards
+    return merge_spa_catalogs(shards, load_shard_catalogs(shards, "spas"))
+
+
+# ────────────────────────────────────────────────
+# Delt katalog-snapshot (valgfrit – flere replikaer på samme maskine)
+# ────────────────────────────────────────────────
+# Aktiveres i secrets:
+#   [catalog_snapshot]
+#   path = "/var/lib/fairpool/katalog.bin"
+#   refresh_seconds = 300          # hvor ofte en ventende replika forsøger at overtage fil-låsen
+# Den replika der får fil-låsen henter alle områder (hver med sin TTL, og med det samme når et regneark
+# er ændret) og skriver en versioneret binær fil.
+# Hvert områdes pools og SPA'er ligger som hver sin komprimerede blok bag et lille indeks.
+# Replikaerne læser kun headeren pr. kørsel og pakker først et område ud, når det bruges –
+# og igen kun hvis blokken er ændret i en ny version. Sheets-trafikken vokser derfor ikke med
+# antallet af replikaer, men hver replika har sin egen udpakkede kopi af de områder den bruger.
+SNAPSHOT_CONFIG = st.secrets.get("catalog_snapshot", {})
+SNAPSHOT_MAGIC = b"FPCAT004"
+SNAPSHOT_HEADER = struct.Struct(">8sQQ")   # magic, version (ms), længde af indeks
+
+
+def snapshot_path():
+    path = SNAPSHOT_CONFIG.get("path")
+    return Path(path) if path else None
+
+
+def write_catalog_snapshot(path, shard_values, fetched_at):
+    # Indeks: område → type → [offset, længde, crc32, hentet] for blokken efter indekset
+    index, blocks, offset = {}, [], 0
+    for name, values in shard_values.items():
+        for kind in ("pools", "spas"):
+            block = zlib.compress(json.dumps(values[kind], ensure_ascii=False).encode("utf-8"))
+            index.setdefault(name, {})[kind] = [offset, len(block), zlib.crc32(block), fetched_at[name]]
+            blocks.append(block)
+            offset += len(block)
+    index_bytes = json.dumps(index, ensure_ascii=False).encode("utf-8")
+    version = time.time_ns() // 1_000_000
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, version, len(index_bytes)))
+        f.write(index_bytes)
+        f.writelines(blocks)
+        f.flush()
+        os.fsync(f.fileno())
+    # Atomisk udskiftning – læsere der har den gamle fil åben ser stadig en hel version
+    os.replace(tmp_path, path)
+    return version
+
+
+@st.cache_resource
+def _snapshot_holder():
+    # catalogs: (område, type) → katalog – kun de områder replikaen har brugt
+    return {"version": None, "index": None, "base": 0, "mm": None, "catalogs": {}, "lock": threading.Lock()}
+
+
+def get_catalog_snapshot():
+    """Holderen med nyeste snapshot-version åbnet, eller None hvis det ikke er slået til/skrevet endnu."""
+    path = snapshot_path()
+    if path is None:
+        return None
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return None
+
+    holder = _snapshot_holder()
+    with f:
+        header = f.read(SNAPSHOT_HEADER.size)
+        if len(header) < SNAPSHOT_HEADER.size:
+            return None
+        magic, version, index_length = SNAPSHOT_HEADER.unpack(header)
+        if magic != SNAPSHOT_MAGIC:
+            return None
+        if version == holder["version"]:
+            return holder
+
+        with holder["lock"]:
+            if version != holder["version"]:
+                # Mappingen overlever at filen lukkes og erstattes – den gamle version forbliver hel
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                index = json.loads(mm[SNAPSHOT_HEADER.size:SNAPSHOT_HEADER.size + index_length])
+                old_index, old_catalogs = holder["index"], holder["catalogs"]
+                if holder["mm"] is not None:
+                    holder["mm"].close()
+                holder.update(version=version, index=index, base=SNAPSHOT_HEADER.size + index_length,
+                              mm=mm, catalogs={})
+                # Områder der allerede bruges: uændrede blokke genbruges, ændrede pakkes ud nu,
+                # så ændringsbussen (og bannerne) ser ændringen uden at vente på næste kørsel
+                for (name, kind), catalog in old_catalogs.items():
+                    entry = index.get(name, {}).get(kind)
+                    if entry is None:
+                        continue
+                    if entry[2] == old_index[name][kind][2]:
+                        holder["catalogs"][(name, kind)] = catalog
+                        record_catalog_checked(f"{name}/{kind}")
+                    else:
+                        _unpack_snapshot_catalog(holder, name, kind)
+        return holder
+
+
+def _unpack_snapshot_catalog(holder, name, kind):
+    # Kaldes med holder["lock"]
+    started = time.perf_counter()
+    offset, length, _, fetched_at = holder["index"][name][kind]
+    start = holder["base"] + offset
+    with memoryview(holder["mm"]) as view:
+        values = json.loads(zlib.decompress(view[start:start + length]))
+    catalog = parse_catalog(kind, values)
+    holder["catalogs"][(name, kind)] = catalog
+    record_catalog_fetch(f"{name}/{kind}", catalog_size(kind, catalog), time.perf_counter() - started,
+                         "snapshot", fetched_at=fetched_at)
+    publish_catalog(name, kind, catalog)
+    return catalog
+
+
+def snapshot_catalog(shard_name, kind):
+    """(hentet, katalog) for ét område fra det delte snapshot, eller None hvis området ikke er i det."""
+    holder = get_catalog_snapshot()
+    if holder is None:
+        return None
+    with holder["lock"]:
+        if shard_name not in holder["index"]:
+            return None
+        catalog = holder["catalogs"].get((shard_name, kind))
+        if catalog is None:
+            catalog = _unpack_snapshot_catalog(holder, shard_name, kind)
+        return holder["index"][shard_name][kind][3], catalog
+
+
+def _refresh_catalog_snapshot(path, interval):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    lock_file = open(path.with_name(f"{path.name}.lock"), "a+")
+    while True:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            break
+        except BlockingIOError:
+            # En anden replika opdaterer allerede – overtag hvis den forsvinder
+            time.sleep(interval)
+
+    # fetched_at følger værdierne i snapshottet, refreshed_at styrer hvornår området skal hentes igen
+    shard_values, fetched_at, refreshed_at, last_modified = {}, {}, {}, {}
+    while True:
+        shards = catalog_shards()
+        changed = changed_shard_kinds(shards, last_modified)
+        now = time.time()   # før hentningen – alt skrevet inden da er med i værdierne
+        due = [s for s in shards
+               if now - refreshed_at.get(s["name"], 0) >= s["ttl"]
+               or any(name == s["name"] for name, _ in changed)]
+        if due:
+            with ThreadPoolExecutor(max_workers=min(8, len(due)), thread_name_prefix="refresh") as executor:
+                results = list(executor.map(_download_shard, due))
+            for shard, values in zip(due, results):
+                if values is not None:
+                    shard_values[shard["name"]] = values
+                    fetched_at[shard["name"]] = refreshed_at[shard["name"]] = now
+                else:
+                    refreshed_at.pop(shard["name"], None)   # prøv igen ved næste tjek
+            try:
+                write_catalog_snapshot(path, shard_values, fetched_at)
+            except OSError:
+                logger.exception("Kunne ikke skrive katalog-snapshot")
+        time.sleep(CHANGE_POLL_SECONDS)
+
+
+def _download_shard(shard):
+    try:
+        started = time.perf_counter()
+        values = {
+            kind: get_shard_sheet(shard, kind).get_all_values() if shard_has(shard, kind) else []
+            for kind in ("pools", "spas")
+        }
+        record_catalog_fetch(f"{shard['name']}/snapshot_refresh", sum(len(v) for v in values.values()),
+                             time.perf_counter() - started, "sheets")
+        return values
+    except Exception as exc:
+        logger.exception("Kunne ikke hente området %s til katalog-snapshot", shard["name"])
+        record_catalog_error(f"{shard['name']}/snapshot_refresh", exc)
+        return None
+
+
+@st.cache_resource
+def start_catalog_refresher():
+    path = snapshot_path()
+    if path is None:
+        return None
+    interval = float(SNAPSHOT_CONFIG.get("refresh_seconds", 300))
+    thread = threading.Thread(
+        target=_refresh_catalog_snapshot, args=(path, interval), name="catalog-refresher", daemon=True
+    )
+    thread.start()
+    return thread
+
+
+# ────────────────────────────────────────────────
+# Ændringer i kataloget – sendes ud til åbne sessioner
+# ────────────────────────────────────────────────
+# Hver gang et katalog hentes/pakkes ud, sammenlignes det post for post med forrige udgave.
+# Ændrede poster lægges på en fælles "bus" med et stigende versionsnummer. Åbne sessioner
+# spørger bussen hvert CHANGE_POLL_SECONDS sekund (ingen Sheets-kald) og viser et banner.
+# En baggrundstråd spørger Drive om regnearkenes ændringstidspunkt og henter kun
+# områder der faktisk er ændret – TTL'en på kataloget er uændret.
+CHANGE_POLL_SECONDS = 10
+CHANGE_HISTORY_SIZE = 500
+
+
+@st.cache_resource
+def get_change_bus():
+    return {"version": 0, "records": {}, "changes": deque(maxlen=CHANGE_HISTORY_SIZE), "lock": threading.Lock()}
+
+
+def _record_fingerprints(kind, catalog):
+    """Post → {felt: checksum} så ændrede felter kan nævnes i banneret."""
+    def checksum(value):
+        return zlib.crc32(repr(value).encode("utf-8"))
+
+    if kind == "pools":
+        pools, pool_info = catalog
+        return {
+            name: {"Volumen": checksum(vol), **{k: checksum(v) for k, v in pool_info.get(name, {}).items()}}
+            for name, vol in pools.items()
+        }
+    columns = catalog["columns"]
+    return {
+        name: {col: checksum(values[i]) for col, values in columns.items() if not col.endswith("_type")}
+        for i, name in enumerate(catalog["display_name"])
+    }
+
+
+def publish_catalog(shard_name, kind, catalog):
+    bus = get_change_bus()
+    fingerprints = _record_fingerprints(kind, catalog)
+    with bus["lock"]:
+        previous = bus["records"].get((shard_name, kind))
+        bus["records"][(shard_name, kind)] = fingerprints
+        if previous is None:
+            return   # første indlæsning i processen – intet at sammenligne med
+        changes = []
+        for key, fields in fingerprints.items():
+            old = previous.get(key)
+            if old is None:
+                changes.append((key, ["ny"]))
+            elif old != fields:
+                changes.append((key, [f for f in fields if old.get(f) != fields[f]]))
+        changes += [(key, ["fjernet"]) for key in previous.keys() - fingerprints.keys()]
+        if changes:
+            bus["version"] += 1
+            for key, fields in changes:
+                bus["changes"].append({"version": bus["version"], "shard": shard_name, "kind": kind,
+                                       "key": key, "fields": fields})
+
+
+def catalog_changes_since(version, shard_names, kinds):
+    bus = get_change_bus()
+    with bus["lock"]:
+        return [c for c in bus["changes"]
+                if c["version"] > version and c["shard"] in shard_names and c["kind"] in kinds]
+
+
+@st.cache_resource
+def _own_writes():
+    # regneark → ændringstidspunkt lige efter appens egen skrivning
+    return {}
+
+
+def note_own_write(sheet_id):
+    """Husk regnearkets ændringstidspunkt efter en skrivning appen selv har lavet (og allerede har hentet).
+
+    Ændringsovervågningen springer så netop den ændring over, i stedet for at hente hele
+    regnearkets kataloger igen – fx når en måling gemmes i Målinger-fanen i pool-sheetet.
+    Med delt snapshot gøres intet: refresheren skal opdage ændringen og skrive snapshottet om,
+    så de andre replikaer også ser den.
+    """
+    if snapshot_path() is not None:
+        return
+    try:
+        _own_writes()[sheet_id] = spreadsheet_modified_time(sheet_id)
+    except Exception:
+        logger.exception("Kunne ikke læse ændringstidspunkt for %s", sheet_id)
+
+
+def changed_shard_kinds(shards, last_modified):
+    """(område, type) hvis regneark er ændret siden sidste kald. Opdaterer last_modified."""
+    by_sheet = {}
+    for shard in shards:
+        for kind, sheet_id in (("pools", shard["pool_sheet_id"]), ("spas", shard["spa_sheet_id"])):
+            if shard_has(shard, kind):
+                by_sheet.setdefault(sheet_id, []).append((shard["name"], kind))
+
+    changed = set()
+    for sheet_id, shard_kinds in by_sheet.items():
+        try:
+            modified = spreadsheet_modified_time(sheet_id)
+        except Exception as exc:
+            logger.exception("Kunne ikke læse ændringstidspunkt for %s", sheet_id)
+            for name, kind in shard_kinds:
+                record_catalog_error(f"{name}/{kind}", exc, create=False)
+            continue
+        if (sheet_id in last_modified and modified != last_modified[sheet_id]
+                and modified != _own_writes().get(sheet_id)):
+            changed.update(shard_kinds)
+        else:
+            # Uændret regneark – det cachede katalog er stadig aktuelt
+            for name, kind in shard_kinds:
+                record_catalog_checked(f"{name}/{kind}")
+        last_modified[sheet_id] = modified
+    return changed
+
+
+def _watch_catalog_changes():
+    last_modified = {}
+    while True:
+        time.sleep(CHANGE_POLL_SECONDS)
+        shards = {s["name"]: s for s in catalog_shards()}
+        for name, kind in changed_shard_kinds(shards.values(), last_modified) & cached_shard_kinds():
+            invalidate_shard(shards[name], kind)
+            try:
+                fetch_shard_catalog(shards[name], kind)
+            except Exception:
+                logger.exception("Kunne ikke hente ændret område %s", name)
+                # Glem tidsstemplet, så ændringen opdages (og hentes) igen ved næste tjek
+                last_modified[shards[name]["pool_sheet_id" if kind == "pools" else "spa_sheet_id"]] = None
+
+
+@st.cache_resource
+def start_change_watcher():
+    # Med delt snapshot er det refresheren der holder øje med ændringer
+    if snapshot_path() is not None:
+        return None
+    thread = threading.Thread(target=_watch_catalog_changes, name="catalog-watcher", daemon=True)
+    thread.start()
+    return thread
+
+
+@st.cache_data(ttl=300)
+def load_history():
+    sheet = get_history_sheet()
+    values = sheet.get_all_values() if sheet is not None else []
+    if len(values) < 2:
+        return pd.DataFrame(columns=HISTORY_HEADERS)
+
+    headers = [h.strip() for h in values[0]]
+    rows = [(row + [""] * len(headers))[:len(headers)] for row in values[1:]]
+    history = pd.DataFrame(rows, columns=headers).reindex(columns=HISTORY_HEADERS)
+
+    history["Dato"] = pd.to_datetime(history["Dato"], errors="coerce")
+    for col in ("pH", "Klor", "Sticks"):
+        history[col] = pd.to_numeric(history[col].astype(str).str.replace(",", "."), errors="coerce")
+    history["Sticks"] = history["Sticks"].fillna(0)
+    history["Udlejet"] = history["Udlejet"].astype(str).str.strip().str.lower().isin(("ja", "udlejet", "true", "1"))
+    history["Type"] = history["Type"].astype(str).str.strip().str.lower()
+    history["Objekt"] = history["Objekt"].astype(str).str.strip()
+
+    history = history[history["Objekt"] != ""].dropna(subset=["Dato"])
+    return history.sort_values("Dato").reset_index(drop=True)
+
+
+def add_pool(name, vol, shard):
+    get_shard_sheet(shard, "pools").append_row([name, vol, "", name, "", "", ""])
+    invalidate_shard(shard, "pools")
+    fetch_shard_catalog(shard, "pools")   # henter og udsender ændringen med det samme
+    note_own_write(shard["pool_sheet_id"])
+
+def add_measurement(object_type, name, ph, cl, leased, sticks):
+    get_history_sheet(create=True).append_row([
+        datetime.now().strftime("%Y-%m-%d %H:%M"), object_type, name, ph, cl,
+        "Ja" if leased else "Nej", sticks
+    ])
+    load_history.clear()
+    note_own_write(HISTORY_SHEET_ID)
+
+# ────────────────────────────────────────────────
+# Masseimport og eksport af kataloger
+# ────────────────────────────────────────────────
+IMPORT_BATCH_ROWS = 500        # rækker pr. append_rows-kald mod Sheets
+
+
+def values_to_frame(values):
+    """Sheet-værdier (liste af rækker) som DataFrame med tekstkolonner i sheetets layout."""
+    if not values:
+        return pd.DataFrame()
+    headers = [h.strip() or f"Kolonne {i + 1}" for i, h in enumerate(values[0])]
+    rows = [(row + [""] * len(headers))[:len(headers)] for row in values[1:]]
+    return pd.DataFrame(rows, columns=headers, dtype=str)
+
+
+def read_import_file(uploaded, kind):
+    suffix = Path(uploaded.name).suffix.lower()
+    if suffix == ".csv":
+        return pd.read_csv(uploaded, dtype=str, sep=None, engine="python", encoding="utf-8-sig",
+                           keep_default_na=False)
+    if suffix == ".xlsx":
+        return pd.read_excel(uploaded, dtype=str, keep_default_na=False)
+    if suffix == ".parquet":
+        return pd.read_parquet(uploaded).fillna("").astype(str)
+    if suffix == ".zip":
+        # Eksport-filen fra appen indeholder både pools.parquet og spas.parquet
+        with zipfile.ZipFile(uploaded) as archive:
+            with archive.open(f"{kind}s.parquet") as member:
+                return pd.read_parquet(io.BytesIO(member.read())).fillna("").astype(str)
+    raise ValueError(f"Ukendt filtype: {suffix}")
+
+
+def validate_import(frame, headers, kind, existing):
+    """Gyldige rækker i sheetets kolonnerækkefølge + liste over problemer (rækker med fejl springes over)."""
+    headers = [h.strip() for h in headers]
+    # Uden overskriftsrække ved vi ikke hvilken kolonne værdierne skal i
+    if len([h for h in headers if h]) < (2 if kind == "pool" else 1):
+        return [], [{"Række": 1, "Kolonne": "", "Værdi": "", "Problem": "sheetet mangler kolonneoverskrifter i række 1"}]
+    frame = frame.rename(columns=lambda c: str(c).strip()).fillna("").astype(str)
+    problems = [
+        {"Række": "", "Kolonne": c, "Værdi": "", "Problem": "kolonnen findes ikke i sheetet – ignoreres"}
+        for c in frame.columns if c not in headers
+    ]
+
+    if kind == "pool":
+        name_col = headers[0]
+        vol_col = "Volumen (m3)" if "Volumen (m3)" in headers else headers[1]
+        required = [name_col, vol_col]
+    else:
+        required = [c for c in ("ObjektNummer", "Adresse") if c in frame.columns][:1] or ["ObjektNummer"]
+    missing = [c for c in required if c not in frame.columns]
+    if missing:
+        problems += [{"Række": "", "Kolonne": c, "Værdi": "", "Problem": "påkrævet kolonne mangler"} for c in missing]
+        return [], problems
+
+    rows, seen = [], set(existing)
+    for row_no, record in enumerate(frame.to_dict("records"), start=2):
+        record = {k: v.strip() for k, v in record.items()}
+        if not any(record.values()):
+            continue
+        row_problems = []
+
+        if kind == "pool":
+            key = record[name_col]
+            if not key or key.startswith("-"):
+                row_problems.append((name_col, key, "mangler pool-navn eller starter med -"))
+            try:
+                # Gemmes som tal – rækkerne skrives RAW, så Sheets ikke selv fortolker cellerne
+                record[vol_col] = float(record[vol_col].replace(",", "."))
+            except ValueError:
+                row_problems.append((vol_col, record[vol_col], "volumen er ikke et tal"))
+        else:
+            key = f"{record.get('ObjektNummer', '')} - {record.get('Adresse', '')}".strip(" -")
+            if not key:
+                row_problems.append(("ObjektNummer", "", "mangler både ObjektNummer og Adresse"))
+            for col, col_kind in SPA_SCHEMA.items():
+                if col in record:
+                    _, problem = _normalize_spa_cell(col_kind, record[col])
+                    if problem:
+                        row_problems.append((col, record[col], problem))
+
+        if key and key in seen:
+            row_problems.append((required[0], key, "findes allerede i kataloget eller filen"))
+        if row_problems:
+            problems += [{"Række": row_no, "Kolonne": c, "Værdi": v, "Problem": p} for c, v, p in row_problems]
+            continue
+        seen.add(key)
+        rows.append([record.get(h, "") for h in headers])
+    return rows, problems
+
+
+def append_rows_batched(sheet, rows):
+    for start in range(0, len(rows), IMPORT_BATCH_ROWS):
+        sheet.append_rows(rows[start:start + IMPORT_BATCH_ROWS], value_input_option="RAW")
+
+
+def import_catalog_rows(shard, kind, rows):
+    append_rows_batched(get_shard_sheet(shard, f"{kind}s"), rows)
+    invalidate_shard(shard, f"{kind}s")
+    fetch_shard_catalog(shard, f"{kind}s")
+    note_own_write(shard["pool_sheet_id" if kind == "pool" else "spa_sheet_id"])
+
+
+@st.cache_data(ttl=300, show_spinner="Henter kataloger til eksport …")
+def export_catalogs(shard_name):
+    """Zip med områdets pools.parquet og spas.parquet (zstd-komprimeret, samme kolonner som sheetene)."""
+    shard = next(s for s in catalog_shards() if s["name"] == shard_name)
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for kind in ("pools", "spas"):
+            values = get_shard_sheet(shard, kind).get_all_values() if shard_has(shard, kind) else []
+            parquet = io.BytesIO()
+            values_to_frame(values).to_parquet(parquet, compression="zstd", index=False)
+            archive.writestr(f"{kind}.parquet", parquet.getvalue())
+    return buffer.getvalue()
+
+# ────────────────────────────────────────────────
+# Doseringsregler (bruges af pool/SPA-visningen og planlægningen)
+# ────────────────────────────────────────────────
+POOL_TARGET_PH = 7.0
+POOL_TARGET_CL_LEAVE = 4.0
+SPA_TARGET_PH = 7.0
+SPA_TARGET_CL = 4.0
+STICK_CL_25M3 = 8.0            # mg/l pr. Tempo Stick i 25 m³
+STICK_PH_25M3 = 0.4            # pH-stigning pr. Tempo Stick i 25 m³
+
+
+def pool_volume_factor(volume):
+    """25 m³ / volumen – Tempo Sticks doseres pr. 25 m³ (0 når volumen er ukendt)."""
+    volume = np.asarray(volume, float)
+    return np.where(volume > 0, 25.0 / np.where(volume > 0, volume, 1.0), 0.0)
+
+
+def spa_volume_counts(spa_liter):
+    """(SunWac, Tab Twenty) i stk for en SPA – afhænger kun af vandmængden."""
+    liter = np.asarray(spa_liter, float)
+    sunwac = np.where(liter > 1000, np.maximum(1, np.round(liter / 1000)),
+                      np.maximum(1, np.round(np.where(liter > 0, liter, 500) / 500)))
+    tab_twenty = np.maximum(2, np.round(np.where(liter > 0, liter, 2500) / 2500) * 2)
+    return sunwac, tab_twenty
+
+
+def pool_dosing_arrays(volume, current_ph, current_cl, leased, has_existing_stick, per_25m3=None):
+    """Doseringsreglerne for pools på arrays – ét element pr. pool. pool_dosing er udgaven for én pool."""
+    volume = np.asarray(volume, float)
+    current_ph = np.asarray(current_ph, float)
+    current_cl = np.asarray(current_cl, float)
+    leased = np.asarray(leased, bool)
+    has_existing_stick = np.asarray(has_existing_stick, bool)
+    per_25m3 = pool_volume_factor(volume) if per_25m3 is None else np.asarray(per_25m3, float)
+
+    target_cl_maintenance = np.where(leased, 5.5, 3.8)
+    target_klor_op = np.where(current_cl <= 0.3, 6.0, 4.0)
+    delta_cl_leave = np.maximum(0, target_klor_op - current_cl)
+    new_cl_after_leave = current_cl + delta_cl_leave
+
+    delta_cl_maint = np.maximum(0, target_cl_maintenance - new_cl_after_leave)
+    raise_here = STICK_CL_25M3 * per_25m3
+    stick_case = ~has_existing_stick & leased & (per_25m3 > 0) & (new_cl_after_leave <= 4.0)
+    sticks_needed = np.where(stick_case, np.where(
+        delta_cl_maint > 0,
+        np.maximum(1, np.round(delta_cl_maint / np.where(raise_here > 0, raise_here, 1.0))),
+        1), 0)
+    ph_rise_from_sticks = STICK_PH_25M3 * sticks_needed * per_25m3
+
+    ph_rise_from_briqs = delta_cl_leave * 0.05
+    expected_ph_after_klor = current_ph + ph_rise_from_briqs + ph_rise_from_sticks
+
+    minus = (current_ph > POOL_TARGET_PH) | (expected_ph_after_klor > POOL_TARGET_PH)
+    plus = ~minus & (current_ph < POOL_TARGET_PH) & (expected_ph_after_klor < POOL_TARGET_PH)
+    ph_delta = np.select(
+        [minus, plus],
+        [np.maximum(current_ph - POOL_TARGET_PH, expected_ph_after_klor - POOL_TARGET_PH),
+         POOL_TARGET_PH - expected_ph_after_klor],
+        0.0)
+
+    high_cl = current_cl > 6.0
+    return {
+        "target_klor_op": target_klor_op,
+        "delta_cl_leave": delta_cl_leave,
+        "new_cl_after_leave": new_cl_after_leave,
+        "sticks_needed": sticks_needed,
+        "ph_rise_from_sticks": ph_rise_from_sticks,
+        "added_cl_sticks": sticks_needed * STICK_CL_25M3 * per_25m3,
+        "expected_ph_after_klor": expected_ph_after_klor,
+        "ph_action": np.select([minus, plus], ["minus", "plus"], ""),
+        "ph_delta": ph_delta,
+        "ph_minus_ml": np.where(minus, 35 * ph_delta * volume, 0.0),
+        "ph_plus_ml": np.where(plus, 49 * ph_delta * volume, 0.0),
+        "antiklor": np.where(high_cl, 0.83 * (current_cl - POOL_TARGET_CL_LEAVE) * volume, 0.0),
+        "briqs": np.where(~high_cl & (delta_cl_leave >= 0.3), 0.21 * delta_cl_leave * volume, 0.0),
+    }
+
+
+def pool_dosing(volume, current_ph, current_cl, leased, has_existing_stick):
+    dose = pool_dosing_arrays([volume], [current_ph], [current_cl], [leased], [has_existing_stick])
+    dose = {key: value[0].item() for key, value in dose.items()}
+    dose["ph_action"] = dose["ph_action"] or None
+    dose["sticks_needed"] = int(dose["sticks_needed"])
+    return dose
+
+
+def spa_dosing_arrays(spa_liter, current_ph, current_cl, sunwac_count=None, tab_twenty=None):
+    """Doseringsreglerne for SPA'er på arrays – ét element pr. SPA. spa_dosing er udgaven for én SPA."""
+    liter = np.asarray(spa_liter, float)
+    current_ph = np.asarray(current_ph, float)
+    current_cl = np.asarray(current_cl, float)
+    if sunwac_count is None or tab_twenty is None:
+        sunwac_count, tab_twenty = spa_volume_counts(liter)
+
+    delta_ph = current_ph - SPA_TARGET_PH
+    minus = delta_ph > 0.2
+    plus = delta_ph < -0.2
+    liter_ref = np.where(liter > 0, liter, 1000.0)
+    ph_trin = delta_ph / 0.1
+
+    delta_cl = current_cl - SPA_TARGET_CL
+    raise_cl = delta_cl < -0.5
+    high_cl = ~raise_cl & (delta_cl > 1.5)
+    return {
+        "delta_ph": delta_ph,
+        "ph_action": np.select([minus, plus], ["minus", "plus"], ""),
+        "spacare_ml": np.where(minus, np.round(25 * ph_trin * (liter_ref / 1000)), 0),
+        "saniklar_g": np.where(minus, np.round(15 * ph_trin * (liter_ref / 1000)), 0),
+        "ph_plus_ml": np.where(plus, np.round(25 * np.abs(delta_ph) * 1.5), 0),
+        "cl_action": np.select([raise_cl, high_cl], ["raise", "high"], ""),
+        "sunwac_name": np.where(raise_cl, np.where(liter > 1000, "SunWac 12", "SunWac 9"), ""),
+        "sunwac_count": np.where(raise_cl, sunwac_count, 0),
+        "tab_twenty": np.where(high_cl, 0, tab_twenty),
+    }
+
+
+def spa_dosing(spa_liter, current_ph, current_cl):
+    dose = spa_dosing_arrays([spa_liter], [current_ph], [current_cl])
+    dose = {key: value[0].item() for key, value in dose.items()}
+    dose["ph_action"] = dose["ph_action"] or None
+    dose["cl_action"] = dose["cl_action"] or None
+    for key in ("spacare_ml", "saniklar_g", "ph_plus_ml", "sunwac_count", "tab_twenty"):
+        dose[key] = int(dose[key])
+    return dose
+
+
+def dosing_summary(object_type, volume, current_ph, current_cl, leased=True, has_existing_stick=False):
+    """Kort tekst med doseringen til tjeklister, fx 'pH-minus 350 ml · HTH 5 stk'."""
+    parts = []
+    if object_type == "spa":
+        dose = spa_dosing(volume * 1000, current_ph, current_cl)
+        if dose["spacare_ml"]:
+            parts.append(f"SpaCare pH Down {dose['spacare_ml']} ml")
+        elif dose["ph_plus_ml"]:
+            parts.append(f"pH-plus {dose['ph_plus_ml']} ml")
+        if dose["cl_action"] == "raise":
+            parts.append(f"{dose['sunwac_name']} {dose['sunwac_count']} stk")
+        elif dose["cl_action"] == "high":
+            parts.append("Klor for højt")
+        if dose["tab_twenty"]:
+            parts.append(f"Tab Twenty {dose['tab_twenty']} stk")
+    else:
+        dose = pool_dosing(volume, current_ph, current_cl, leased, has_existing_stick)
+        if dose["ph_minus_ml"]:
+            parts.append(f"pH-minus {dose['ph_minus_ml']:.0f} ml")
+        elif dose["ph_plus_ml"]:
+            parts.append(f"pH-plus {dose['ph_plus_ml']:.0f} ml")
+        if dose["antiklor"]:
+            parts.append(f"Anti-klor {dose['antiklor']:.0f} g")
+        if dose["briqs"]:
+            parts.append(f"HTH {round(dose['briqs'])} stk")
+        if dose["sticks_needed"]:
+            parts.append(f"Tempo Sticks {dose['sticks_needed']} stk")
+    return " · ".join(parts) or "Ingen dosering"
+
+
+# Varebilens lager: produkt → enhed. Rækkefølgen er den der vises på læsselisten.
+VAN_PRODUCTS = {
+    "HTH Briquetter": "stk",
+    "Tempo Sticks": "stk",
+    "pH-minus": "ml",
+    "pH-plus": "ml",
+    "Anti-klor": "g",
+    "SpaCare pH Down": "ml",
+    "SunWac 9": "stk",
+    "SunWac 12": "stk",
+    "Tab Twenty": "stk",
+    "Pipe Cleaner": "flaske",
+    "Pipe Cleaner Plus": "flaske",
+}
+
+
+def batch_dosing(plan):
+    """Doseringen for mange pools og SPA'er på én gang – samme regler som pool_dosing og spa_dosing.
+
+    plan er rækker fra build_fleet_frame med kolonnerne Klor, pH, Stick i vandet og Vandskift.
+    Returnerer ét produkt pr. kolonne (se VAN_PRODUCTS) med samme index som plan.
+    """
+    is_spa = (plan["Type"] == "spa").to_numpy()
+    liter = plan["Liter"].to_numpy(float)
+    water_change = is_spa & plan["Vandskift"].to_numpy(bool)
+    ph = plan["pH"].to_numpy(float)
+    # Efter vandskift er der frisk vand uden klor
+    cl = np.where(water_change, 0.0, plan["Klor"].to_numpy(float))
+
+    pool_dose = pool_dosing_arrays(plan["Volumen (m³)"], ph, cl, plan["Udlejet"], plan["Stick i vandet"],
+                                   per_25m3=plan["Pr. 25 m³"])
+    spa_dose = spa_dosing_arrays(liter, ph, cl, plan["SunWac (stk)"].to_numpy(float),
+                                 plan["Tab Twenty (stk)"].to_numpy(float))
+
+    pool, spa = ~is_spa, is_spa
+    return pd.DataFrame({
+        "HTH Briquetter": np.where(pool, np.round(pool_dose["briqs"]), 0),
+        "Tempo Sticks": np.where(pool, pool_dose["sticks_needed"], 0),
+        "pH-minus": np.where(pool, pool_dose["ph_minus_ml"], 0),
+        "pH-plus": np.where(pool, pool_dose["ph_plus_ml"], spa_dose["ph_plus_ml"]),
+        "Anti-klor": np.where(pool, pool_dose["antiklor"], 0),
+        "SpaCare pH Down": np.where(spa, spa_dose["spacare_ml"], 0),
+        "SunWac 9": np.where(spa & (spa_dose["sunwac_name"] == "SunWac 9"), spa_dose["sunwac_count"], 0),
+        "SunWac 12": np.where(spa & (spa_dose["sunwac_name"] == "SunWac 12"), spa_dose["sunwac_count"], 0),
+        "Tab Twenty": np.where(spa, spa_dose["tab_twenty"], 0),
+        "Pipe Cleaner": (water_change & (liter <= 1000)).astype(float),
+        "Pipe Cleaner Plus": (water_change & (liter > 1000)).astype(float),
+    }, index=plan.index)
+
+
+def van_stock(doses, margin):
+    """Læsseliste: samlet behov pr. produkt og behov inkl. sikkerhedsmargin (rundet op)."""
+    # Afrundes før der rundes op, så 699.9999 ml ikke bliver til 701 ml
+    total = doses[list(VAN_PRODUCTS)].sum().to_numpy()
+    return pd.DataFrame({
+        "Produkt": list(VAN_PRODUCTS),
+        "Enhed": list(VAN_PRODUCTS.values()),
+        "Objekter": (doses[list(VAN_PRODUCTS)] > 0).sum().to_numpy(),
+        "Behov": np.ceil(np.round(total, 6)).astype(int),
+        "Med margin": np.ceil(np.round(total * (1 + margin), 6)).astype(int),
+    })
+
+# ────────────────────────────────────────────────
+# Prognose – klorforbrug, pH-drift og næste besøg
+# ────────────────────────────────────────────────
+# Klor falder som 1. ordens henfald (C·e^(-k·t)), mens Tempo Sticks / Tab Twenty
+# tilfører en konstant mængde klor pr. døgn så længe de holder.
+# Forbrug pr. døgn er angivet for 25 m³ (pool) og 1000 liter (SPA) – små vandmængder
+# har relativt større overflade og forbruger derfor hurtigere.
+POOL_DECAY_LEASED = 0.30
+POOL_DECAY_IDLE = 0.12
+SPA_DECAY_LEASED = 0.45
+SPA_DECAY_IDLE = 0.20
+POOL_PH_DRIFT = 0.03           # pH-stigning pr. døgn (afgasning af CO₂)
+SPA_PH_DRIFT = 0.05
+
+STICK_DAYS = 6.0               # Tempo Sticks / Tab Twenty holder ca. 5-7 dage
+TAB_TWENTY_CL_1000L = 4.0      # mg/l pr. Tab Twenty i 1000 liter
+
+FORECAST_MIN_CL = 1.0          # mg/l – under dette skal objektet besøges
+FORECAST_PH_MIN = 6.8
+FORECAST_PH_MAX = 7.8
+FORECAST_MAX_DAYS = 7          # længste interval mellem to besøg
+FORECAST_HORIZON_DAYS = 14
+FORECAST_STEP_DAYS = 0.25
+
+
+def departure_cl(object_type, cl):
+    """Klor ved afgang efter doseringen, ud fra målingen ved ankomst."""
+    cl = cl.fillna(0.0).to_numpy(float)
+    pool_leave = np.where(cl <= 0.3, 6.0, np.where(cl > 6.0, 4.0, np.maximum(cl, 4.0)))
+    spa_leave = np.where(cl > 5.5, cl, np.maximum(cl, 4.0))
+    return np.where(object_type.to_numpy() == "spa", spa_leave, pool_leave)
+
+
+def history_rates(history):
+    """Sidste besøg og målt klorforbrug / pH-drift pr. objekt ud fra historikken."""
+    columns = ["Type", "Objekt", "Sidste besøg", "Sidste klor", "Sidste pH",
+               "Udlejet", "Sticks", "Klorforbrug", "pH-drift"]
+    if history.empty:
+        return pd.DataFrame(columns=columns)
+
+    h = history.copy()
+    grouped = h.groupby(["Type", "Objekt"], sort=False)
+    prev_leave = pd.Series(departure_cl(h["Type"], h["Klor"]), index=h.index).groupby([h["Type"], h["Objekt"]]).shift()
+    prev_sticks = grouped["Sticks"].shift()
+    days = (h["Dato"] - grouped["Dato"].shift()).dt.total_seconds() / 86400
+
+    # Forbrug kan kun aflæses direkte når der ikke har ligget sticks i mellemtiden
+    measurable = (days > 0.5) & (prev_sticks == 0) & (h["Klor"] > 0)
+    h["Klorforbrug"] = (np.log(prev_leave / h["Klor"].clip(lower=0.05)) / days).where(measurable)
+    h["pH-drift"] = ((h["pH"] - 7.0) / days).where((days > 0.5) & h["pH"].notna())
+
+    rates = h.groupby(["Type", "Objekt"], sort=False).agg(**{
+        "Sidste besøg": ("Dato", "last"),
+        "Sidste klor": ("Klor", "last"),
+        "Sidste pH": ("pH", "last"),
+        "Udlejet": ("Udlejet", "last"),
+        "Sticks": ("Sticks", "last"),
+        "Klorforbrug": ("Klorforbrug", "median"),
+        "pH-drift": ("pH-drift", "median"),
+    }).reset_index()
+    rates["Klorforbrug"] = rates["Klorforbrug"].clip(0.02, 2.0)
+    return rates[columns]
+
+
+def build_fleet_frame(pools, spas, history):
+    """Én række pr. pool/SPA med volumen og seneste kendte tilstand fra historikken."""
+    spa_liter = pd.Series(spas["columns"].get("Liter", []), dtype=float).fillna(0.0)
+    fleet = pd.concat([
+        pd.DataFrame({"Type": "pool", "Objekt": list(pools), "Volumen (m³)": list(pools.values())}),
+        pd.DataFrame({"Type": "spa", "Objekt": spas["display_name"], "Volumen (m³)": spa_liter / 1000}),
+    ], ignore_index=True)
+    fleet["Volumen (m³)"] = fleet["Volumen (m³)"].astype(float)
+    # En tom flåde får float-nøgler fra concat, som merge ikke vil parre med historikkens tekst
+    fleet[["Type", "Objekt"]] = fleet[["Type", "Objekt"]].astype(str)
+
+    fleet = fleet.merge(history_rates(history), on=["Type", "Objekt"], how="left")
+    fleet["Historik"] = fleet["Sidste besøg"].notna()
+    fleet["Sidste besøg"] = pd.to_datetime(fleet["Sidste besøg"]).dt.date.where(fleet["Historik"], date.today())
+    fleet["Udlejet"] = fleet["Udlejet"].fillna(True).astype(bool)
+
+    # Volumenafledte størrelser til doseringsreglerne – regnes én gang, så en plan med mange
+    # objekter kun skal regne på målingerne (se batch_dosing)
+    volume = fleet["Volumen (m³)"].to_numpy()
+    liter = np.concatenate([volume[:len(pools)] * 1000, spa_liter.to_numpy()])
+    fleet["Liter"] = liter
+    fleet["Pr. 25 m³"] = pool_volume_factor(volume)
+    fleet["SunWac (stk)"], fleet["Tab Twenty (stk)"] = spa_volume_counts(liter)
+
+    # Uden historik foreslås den dosering appen selv ville give ved et besøg i dag
+    default_sticks = np.where(fleet["Type"] == "spa", fleet["Tab Twenty (stk)"], np.where(fleet["Udlejet"], 1, 0))
+    fleet["Sticks"] = fleet["Sticks"].fillna(pd.Series(default_sticks, index=fleet.index)).astype(int)
+    return fleet
+
+
+def forecast_fleet(fleet, today=None):
+    """Fremskriver klor og pH for hele flåden på én gang og rangerer næste besøg."""
+    today = today or date.today()
+    if fleet.empty:
+        return fleet.assign(**{"Forventet klor nu": [], "Forventet pH nu": [], "Næste besøg": [],
+                               "Dage til besøg": [], "Årsag": []})
+
+    is_spa = (fleet["Type"] == "spa").to_numpy()
+    leased = fleet["Udlejet"].to_numpy(bool)
+    sticks = fleet["Sticks"].fillna(0).to_numpy(float)
+    ref_vol = np.where(is_spa, 1.0, 25.0)
+    vol = fleet["Volumen (m³)"].fillna(0).to_numpy(float)
+    scale = ref_vol / np.where(vol > 0, vol, ref_vol)
+
+    base_k = np.where(is_spa,
+                      np.where(leased, SPA_DECAY_LEASED, SPA_DECAY_IDLE),
+                      np.where(leased, POOL_DECAY_LEASED, POOL_DECAY_IDLE)) * scale ** 0.25
+    k = fleet["Klorforbrug"].fillna(pd.Series(base_k, index=fleet.index)).to_numpy(float)
+    drift = fleet["pH-drift"].fillna(pd.Series(np.where(is_spa, SPA_PH_DRIFT, POOL_PH_DRIFT),
+                                               index=fleet.index)).to_numpy(float)
+
+    c0 = np.where(fleet["Sidste klor"].notna(), departure_cl(fleet["Type"], fleet["Sidste klor"]), 4.0)
+    feed = sticks * np.where(is_spa, TAB_TWENTY_CL_1000L, STICK_CL_25M3) * scale / STICK_DAYS
+    stick_ph = np.where(is_spa, 0.0, sticks * STICK_PH_25M3 * scale / STICK_DAYS)
+
+    # Tidsgitter (objekter × tidspunkter) – alle objekter regnes i samme numpy-operation
+    t = np.arange(0, FORECAST_HORIZON_DAYS + FORECAST_STEP_DAYS, FORECAST_STEP_DAYS)
+    with_feed = np.minimum(t, STICK_DAYS)[None, :]
+    equilibrium = (feed / k)[:, None]
+    cl_end_feed = equilibrium + (c0[:, None] - equilibrium) * np.exp(-k[:, None] * with_feed)
+    cl = cl_end_feed * np.exp(-k[:, None] * (t[None, :] - with_feed))
+    ph = 7.0 + drift[:, None] * t[None, :] + stick_ph[:, None] * with_feed
+
+    low_cl = cl < FORECAST_MIN_CL
+    bad_ph = (ph < FORECAST_PH_MIN) | (ph > FORECAST_PH_MAX)
+    due = low_cl | bad_ph | (t[None, :] >= FORECAST_MAX_DAYS)
+    first_due = due.argmax(axis=1)
+    rows = np.arange(len(fleet))
+
+    last_visit = pd.to_datetime(fleet["Sidste besøg"])
+    elapsed = ((pd.Timestamp(today) - last_visit).dt.days).clip(lower=0).to_numpy()
+    now_idx = np.minimum(np.round(elapsed / FORECAST_STEP_DAYS).astype(int), len(t) - 1)
+    next_visit = last_visit + pd.to_timedelta(pd.Series(np.ceil(t[first_due]), index=fleet.index), unit="D")
+
+    schedule = fleet.assign(**{
+        "Forventet klor nu": cl[rows, now_idx].round(1),
+        "Forventet pH nu": ph[rows, now_idx].round(2),
+        "Næste besøg": next_visit.dt.date,
+        "Dage til besøg": (next_visit - pd.Timestamp(today)).dt.days,
+        "Årsag": np.select([low_cl[rows, first_due], bad_ph[rows, first_due]],
+                           [f"Klor under {FORECAST_MIN_CL} mg/l", "pH uden for 6.8–7.8"],
+                           "Maks. interval"),
+    })
+    return schedule.sort_values(["Næste besøg", "Forventet klor nu"]).reset_index(drop=True)
+
+# ────────────────────────────────────────────────
+# Rute – koordinater, "tæt på mig" og rækkefølge for dagens besøg
+# ────────────────────────────────────────────────
+# Adresser slås ikke op online. Koordinaterne ligger i en lokal fil som kontoret
+# vedligeholder (kolonner: Adresse, Breddegrad, Længdegrad) – typisk udfyldt én gang pr. hus.
+# Stien sættes i secrets.toml, så filen kan ligge uden for kodemappen:
+#   [coordinates]
+#   path = "/var/lib/fairpool/adresse_koordinater.csv"
+COORDINATES_FILE = Path(st.secrets.get("coordinates", {}).get("path")
+                        or Path(__file__).with_name("adresse_koordinater.csv"))
+COORDINATES_HEADERS = ["Adresse", "Breddegrad", "Længdegrad"]
+KM_PER_DEG_LAT = 111.32
+ROUTE_CELL_KM = 2.0            # cellestørrelse i det geografiske grid-indeks
+
+
+def normalize_address(address):
+    return " ".join(str(address).lower().replace(",", " ").split())
+
+
+@st.cache_data
+def _read_coordinates(path, mtime):
+    if not Path(path).exists():
+        return {}
+    table = pd.read_csv(path, dtype=str).reindex(columns=COORDINATES_HEADERS)
+    lat = pd.to_numeric(table["Breddegrad"].str.replace(",", "."), errors="coerce")
+    lon = pd.to_numeric(table["Længdegrad"].str.replace(",", "."), errors="coerce")
+    valid = lat.notna() & lon.notna()
+    return {normalize_address(a): (la, lo) for a, la, lo in zip(table["Adresse"][valid], lat[valid], lon[valid])}
+
+
+def load_coordinates():
+    mtime = COORDINATES_FILE.stat().st_mtime if COORDINATES_FILE.exists() else 0
+    return _read_coordinates(str(COORDINATES_FILE), mtime)
+
+
+def save_coordinates(new_rows):
+    """Tilføjer/overskriver koordinater for adresser i den lokale koordinatfil."""
+    new_rows = new_rows.dropna(subset=["Breddegrad", "Længdegrad"])
+    # Læs-ret-skriv under en fil-lås, så to sessioner (eller replikaer) ikke overskriver hinandens rækker
+    with open(COORDINATES_FILE.with_name(f"{COORDINATES_FILE.name}.lock"), "a+") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        if COORDINATES_FILE.exists():
+            table = pd.read_csv(COORDINATES_FILE, dtype=str).reindex(columns=COORDINATES_HEADERS)
+        else:
+            table = pd.DataFrame(columns=COORDINATES_HEADERS)
+        replaced = table["Adresse"].map(normalize_address).isin(new_rows["Adresse"].map(normalize_address))
+        table = pd.concat([table[~replaced], new_rows[COORDINATES_HEADERS]], ignore_index=True)
+        tmp_path = COORDINATES_FILE.with_name(f"{COORDINATES_FILE.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        table.to_csv(tmp_path, index=False)
+        os.replace(tmp_path, COORDINATES_FILE)
+
+
+def build_route_points(pools, pool_info, spas, coordinates):
+    """Alle objekter med adresse, nøglekode og koordinater (NaN hvis ukendt)."""
+    rows = []
+    for name, vol in pools.items():
+        info = pool_info.get(name, {})
+        adresse = info.get("Adresse", "Ikke angivet")
+        if adresse in ("", "Ikke angivet"):
+            adresse = name
+        rows.append(("pool", name, adresse, info.get("Nøglebokskode", ""), float(vol)))
+    columns = spas["columns"]
+    for i, name in enumerate(spas["display_name"]):
+        rows.append(("spa", name, columns["Adresse"][i] or "", columns["NøgleKode"][i] or "",
+                     (columns["Liter"][i] or 0.0) / 1000))
+    points = pd.DataFrame(rows, columns=["Type", "Objekt", "Adresse", "Kode", "Volumen (m³)"])
+    points["Kode"] = points["Kode"].replace("Ikke angivet", "")
+
+    coords = points["Adresse"].map(lambda a: coordinates.get(normalize_address(a), (np.nan, np.nan)))
+    points["Breddegrad"] = [c[0] for c in coords]
+    points["Længdegrad"] = [c[1] for c in coords]
+    return points
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371.0 * np.arcsin(np.sqrt(a))
+
+
+def build_spatial_index(lat, lon, cell_km=ROUTE_CELL_KM):
+    """Grid-indeks (geohash-lignende celler) så 'tæt på mig' kun ser på nabocellerne."""
+    lat = np.asarray(lat, float)
+    lon = np.asarray(lon, float)
+    dlat = cell_km / KM_PER_DEG_LAT
+    dlon = cell_km / (KM_PER_DEG_LAT * np.cos(np.radians(np.nanmean(lat) if len(lat) else 55.0)))
+    cells = {}
+    for i in np.flatnonzero(~np.isnan(lat) & ~np.isnan(lon)):
+        cells.setdefault((int(lat[i] // dlat), int(lon[i] // dlon)), []).append(i)
+    return {"lat": lat, "lon": lon, "dlat": dlat, "dlon": dlon, "cells": cells}
+
+
+def query_nearby(index, lat, lon, radius_km):
+    """Indeks og afstand (km) for objekter inden for radius, sorteret efter afstand."""
+    reach_lat = int(np.ceil(radius_km / (index["dlat"] * KM_PER_DEG_LAT)))
+    reach_lon = int(np.ceil(radius_km / (index["dlon"] * KM_PER_DEG_LAT * np.cos(np.radians(lat)))))
+    ci, cj = int(lat // index["dlat"]), int(lon // index["dlon"])
+    candidates = [
+        i
+        for di in range(-reach_lat, reach_lat + 1)
+        for dj in range(-reach_lon, reach_lon + 1)
+        for i in index["cells"].get((ci + di, cj + dj), [])
+    ]
+    if not candidates:
+        return np.array([], int), np.array([])
+    candidates = np.array(candidates)
+    dist = haversine_km(lat, lon, index["lat"][candidates], index["lon"][candidates])
+    keep = dist <= radius_km
+    order = np.argsort(dist[keep])
+    return candidates[keep][order], dist[keep][order]
+
+
+def plan_route(lat, lon, start=0, max_passes=50):
+    """Rækkefølge for en åben rute fra start: nærmeste nabo forbedret med 2-opt."""
+    lat = np.asarray(lat, float)
+    lon = np.asarray(lon, float)
+    n = len(lat)
+    if n <= 2:
+        return list(range(n)) if start == 0 else [start] + [i for i in range(n) if i != start]
+
+    dist = haversine_km(lat[:, None], lon[:, None], lat[None, :], lon[None, :])
+    order = [start]
+    visited = np.zeros(n, bool)
+    visited[start] = True
+    for _ in range(n - 1):
+        candidates = np.where(visited, np.inf, dist[order[-1]])
+        nxt = int(candidates.argmin())
+        order.append(nxt)
+        visited[nxt] = True
+
+    for _ in range(max_passes):
+        improved = False
+        for i in range(1, n - 1):
+            for j in range(i + 1, n):
+                a, b, c = order[i - 1], order[i], order[j]
+                change = dist[a, c] - dist[a, b]
+                if j + 1 < n:
+                    d = order[j + 1]
+                    change += dist[b, d] - dist[c, d]
+                if change < -1e-9:
+                    order[i:j + 1] = order[i:j + 1][::-1]
+                    improved = True
+        if not improved:
+            break
+    return order
+
+
+def route_length_km(lat, lon, order):
+    lat = np.asarray(lat, float)[order]
+    lon = np.asarray(lon, float)[order]
+    legs = haversine_km(lat[:-1], lon[:-1], lat[1:], lon[1:])
+    return np.concatenate([[0.0], legs])
+
+# ────────────────────────────────────────────────
+# Forvarmning af caches og health-endpoint
+# ────────────────────────────────────────────────
+# Health-endpointet aktiveres i secrets (porten kan overskrives pr. replika med FAIRPOOL_HEALTH_PORT):
+#   [health]
+#   port = 8502
+#   max_age_seconds = 900   # standard: 3 × længste område-TTL
+# GET /health svarer 200 når katalogerne er varme og alle er hentet eller bekræftet uændrede inden for
+# max_age_seconds – ellers 503 til load balancerens readiness-tjek. Et enkelt mislykket tjek eller hentning
+# giver "degraded" med detaljerne i svaret, men stadig 200: replikaen serverer de sidste gode data.
+# Brug serve.py i produktion, så endpointet og forvarmningen starter med processen.
+HEALTH_CONFIG = st.secrets.get("health", {})
+PREWARM_RETRY_SECONDS = 30
+
+
+@st.cache_resource
+def get_catalog_stats():
+    return {"started_at": time.time(), "warm": False, "error": None, "catalogs": {}, "lock": threading.Lock()}
+
+
+def record_catalog_fetch(name, rows, latency, source, fetched_at=None):
+    stats = get_catalog_stats()
+    fetched_at = fetched_at or time.time()
+    with stats["lock"]:
+        stats["catalogs"][name] = {
+            "rows": rows,
+            "latency_s": round(latency, 3),
+            "source": source,
+            "fetched_at": fetched_at,
+            "checked_at": fetched_at,
+            "error": None,
+        }
+
+
+def record_catalog_checked(name):
+    """Ændringsovervågningen har bekræftet at et cachet katalog stadig er aktuelt."""
+    stats = get_catalog_stats()
+    with stats["lock"]:
+        if name in stats["catalogs"]:
+            stats["catalogs"][name]["checked_at"] = time.time()
+            stats["catalogs"][name]["error"] = None
+
+
+def record_catalog_error(name, exc, create=True):
+    stats = get_catalog_stats()
+    with stats["lock"]:
+        if name not in stats["catalogs"]:
+            if not create:
+                return
+            stats["catalogs"][name] = {"rows": 0, "latency_s": None, "source": None,
+                                       "fetched_at": None, "checked_at": 0.0}
+        stats["catalogs"][name]["error"] = str(exc)
+
+
+def health_max_age():
+    if "max_age_seconds" in HEALTH_CONFIG:
+        return float(HEALTH_CONFIG["max_age_seconds"])
+    return 3 * max(shard["ttl"] for shard in catalog_shards())
+
+
+def health_report():
+    # En replika uden trafik skal også se nye snapshot-versioner, ellers ældes den ud af rotationen
+    try:
+        get_catalog_snapshot()
+    except Exception:
+        logger.exception("Kunne ikke læse katalog-snapshot")
+    stats = get_catalog_stats()
+    now = time.time()
+    max_age = health_max_age()
+    with stats["lock"]:
+        failing = sorted(name for name, c in stats["catalogs"].items() if c["error"])
+        stale = sorted(name for name, c in stats["catalogs"].items() if now - c["checked_at"] > max_age)
+        if not stats["warm"]:
+            status = "error" if stats["error"] else "warming"
+        elif stale:
+            status = "stale"
+        elif failing:
+            status = "degraded"
+        else:
+            status = "ready"
+        return {
+            "status": status,
+            "uptime_s": round(now - stats["started_at"], 1),
+            "error": stats["error"],
+            "failing": failing,
+            "stale": stale,
+            "max_age_s": max_age,
+            "catalogs": {
+                name: {
+                    "rows": c["rows"],
+                    "age_s": round(now - c["checked_at"], 1),
+                    "last_fetch_latency_s": c["latency_s"],
+                    "source": c["source"],
+                    "error": c["error"],
+                }
+                for name, c in stats["catalogs"].items()
+            },
+        }
+
+
+def _prewarm():
+    stats = get_catalog_stats()
+    while True:
+        try:
+            # Klienten deles af alle sheets, så den skal være klar før de parallelle hentninger
+            get_sheets_client()
+            # Kun standard- og forvarmede områder – resten hentes først når en tekniker bruger dem
+            shards = [s for s in catalog_shards() if s["prewarm"]]
+            with ThreadPoolExecutor(max_workers=2, thread_name_prefix="prewarm") as executor:
+                jobs = [executor.submit(load_pools, shards), executor.submit(load_spas, shards)]
+                for job in jobs:
+                    job.result()
+            with stats["lock"]:
+                stats["warm"] = True
+                stats["error"] = None
+            break
+        except Exception as exc:
+            logger.exception("Forvarmning af caches fejlede")
+            with stats["lock"]:
+                stats["error"] = str(exc)
+            time.sleep(PREWARM_RETRY_SECONDS)
+
+    # Historik og koordinater bruges kun på planlægningssiden – readiness venter ikke på dem
+    for load in (load_history, load_coordinates):
+        try:
+            load()
+        except Exception:
+            logger.exception("Forvarmning af %s fejlede", load.__name__)
+
+
+@st.cache_resource
+def prewarm_caches():
+    thread = threading.Thread(target=_prewarm, name="cache-prewarm", daemon=True)
+    thread.start()
+    return thread
+
+
+class _HealthHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/health", "/ready"):
+            self.send_error(404)
+            return
+        report = health_report()
+        body = json.dumps(report).encode("utf-8")
+        self.send_response(200 if report["status"] in ("ready", "degraded") else 503)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@st.cache_resource
+def start_health_server():
+    port = int(os.environ.get("FAIRPOOL_HEALTH_PORT", HEALTH_CONFIG.get("port", 0)))
+    if not port:
+        return None
+    try:
+        server = ThreadingHTTPServer(("0.0.0.0", port), _HealthHandler)
+    except OSError:
+        # Porten er allerede bundet – typisk af serve.py i samme proces
+        logger.exception("Health-endpointet kunne ikke starte på port %s", port)
+        return None
+    threading.Thread(target=server.serve_forever, name="health-server", daemon=True).start()
+    return server
+
+
+# ────────────────────────────────────────────────
+# Sessioner og hukommelse
+# ────────────────────────────────────────────────
+# Konfiguration i secrets (alt er valgfrit):
+#   [admin]
+#   emails = ["chef@fairpool.dk"]   # må se hukommelsesrapporten
+#   idle_minutes = 120              # sessioner uden aktivitet ryddes efter så mange minutter (standard 0 = aldrig)
+#   max_session_kb = 2048           # større session_state beskæres, største nøgler først (standard 0 = aldrig)
+#   trace_memory = true             # tracemalloc – koster lidt CPU, men giver allokeringer pr. kodelinje
+ADMIN_CONFIG = st.secrets.get("admin", {})
+SESSION_IDLE_SECONDS = float(ADMIN_CONFIG.get("idle_minutes", 0)) * 60
+SESSION_MAX_BYTES = int(ADMIN_CONFIG.get("max_session_kb", 0)) * 1024
+SESSION_SWEEP_SECONDS = 60
+# Nøgler der aldrig beskæres – uden dem er teknikeren logget ud eller på forkert side
+SESSION_PROTECTED_KEYS = {
+    "auth_token", "auth_email", "pending_token", "pending_email", "pending_refresh",
+    "service_type", "current_object", "catalog_version",
+}
+MEMORY_TOP_LINES = 25
+
+
+def is_admin(email):
+    return email.strip().lower() in {e.strip().lower() for e in ADMIN_CONFIG.get("emails", [])}
+
+
+def deep_size(obj, seen=None):
+    """Omtrentlig størrelse i bytes af et objekt inkl. indhold. DataFrames og arrays måles direkte."""
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(index=True, deep=True).sum())
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_size(k, seen) + deep_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset, deque)):
+        size += sum(deep_size(item, seen) for item in obj)
+    return size
+
+
+@st.cache_resource
+def start_memory_tracing():
+    if not ADMIN_CONFIG.get("trace_memory", False) or tracemalloc.is_tracing():
+        return tracemalloc.is_tracing()
+    tracemalloc.start(1)
+    return True
+
+
+@st.cache_resource
+def get_session_registry():
+    # session_id → {"email", "service_type", "last_seen", "bytes", "keys"}
+    return {"sessions": {}, "evicted": 0, "trimmed": 0, "last_sweep": 0.0, "lock": threading.Lock()}
+
+
+def active_sessions():
+    """session_id → AppSession for de sessioner Streamlit har åbne lige nu, eller None hvis de ikke kan læses."""
+    if not Runtime.exists():
+        return {}
+    # _session_mgr er ikke offentligt API og kan ændre sig med en ny Streamlit-version
+    try:
+        session_mgr = getattr(Runtime.instance(), "_session_mgr", None)
+        if session_mgr is None:
+            raise AttributeError("Streamlits Runtime har ingen _session_mgr")
+        return {info.session.id: info.session for info in session_mgr.list_active_sessions()}
+    except Exception:
+        logger.exception("Kunne ikke læse Streamlits aktive sessioner")
+        return None
+
+
+def _trim_session_state(state):
+    """Fjern de største ubeskyttede nøgler, indtil sessionen er under SESSION_MAX_BYTES."""
+    sizes = {key: deep_size(value) for key, value in state.items()}
+    total, removed = sum(sizes.values()), []
+    for key in sorted(sizes, key=sizes.get, reverse=True):
+        if not SESSION_MAX_BYTES or total <= SESSION_MAX_BYTES:
+            break
+        if key in SESSION_PROTECTED_KEYS:
+            continue
+        del st.session_state[key]
+        total -= sizes[key]
+        removed.append(key)
+    return total, removed
+
+
+def sweep_idle_sessions(force=False):
+    """Glem lukkede sessioner og markér sessioner der har været inaktive i SESSION_IDLE_SECONDS.
+
+    Selve oprydningen sker i sessionens egen kørsel (clear_if_evicted) – aldrig fra en anden sessions tråd.
+    """
+    registry = get_session_registry()
+    now = time.time()
+    with registry["lock"]:
+        if not force and now - registry["last_sweep"] < SESSION_SWEEP_SECONDS:
+            return 0
+        registry["last_sweep"] = now
+        active = active_sessions()
+        if active is not None:
+            for sid in registry["sessions"].keys() - active.keys():
+                del registry["sessions"][sid]
+        if not SESSION_IDLE_SECONDS:
+            return 0
+        idle = [sid for sid, info in registry["sessions"].items()
+                if not info.get("evict") and now - info["last_seen"] > SESSION_IDLE_SECONDS]
+        for sid in idle:
+            registry["sessions"][sid]["evict"] = True
+    return len(idle)
+
+
+def clear_if_evicted():
+    """Ryd denne sessions state, hvis sweep_idle_sessions har markeret den som inaktiv."""
+    ctx = get_script_run_ctx()
+    if ctx is None:
+        return False
+    registry = get_session_registry()
+    with registry["lock"]:
+        info = registry["sessions"].get(ctx.session_id)
+        if not info or not info.get("evict"):
+            return False
+        del registry["sessions"][ctx.session_id]
+        registry["evicted"] += 1
+    # Næste gang teknikeren rører siden, logges de stille ind igen via cookien
+    for key in list(st.session_state.keys()):
+        del st.session_state[key]
+    return True
+
+
+def track_session():
+    """Registrér denne session og beskær dens state, hvis den er for stor."""
+    ctx = get_script_run_ctx()
+    if ctx is None:
+        return
+    clear_if_evicted()
+    total, removed = _trim_session_state(st.session_state.to_dict())
+    if removed:
+        logger.warning("Session %s var for stor – fjernede %s", ctx.session_id, ", ".join(removed))
+
+    registry = get_session_registry()
+    now = time.time()
+    with registry["lock"]:
+        registry["trimmed"] += len(removed)
+        registry["sessions"][ctx.session_id] = {
+            "email": st.session_state.get("auth_email", ""),
+            "service_type": st.session_state.get("service_type"),
+            "last_seen": now,
+            "bytes": total,
+            "keys": len(st.session_state),
+        }
+
+
+def memory_report():
+    """Sessioner, delte caches og (med tracemalloc) de kodelinjer der holder mest hukommelse."""
+    registry = get_session_registry()
+    now = time.time()
+    active = active_sessions() or {}
+    with registry["lock"]:
+        tracked = {sid: dict(info) for sid, info in registry["sessions"].items()}
+        evicted, trimmed = registry["evicted"], registry["trimmed"]
+    sessions = []
+    for sid, session in active.items():
+        # Måles nu, direkte på sessionens state – også for sessioner der ikke har kørt i et stykke tid
+        state = session.session_state.filtered_state
+        info = tracked.get(sid, {})
+        sessions.append({
+            "Session": sid[:8],
+            "Email": info.get("email", ""),
+            "Side": info.get("service_type") or "",
+            "Inaktiv (min)": round((now - info["last_seen"]) / 60, 1) if info else None,
+            "Nøgler": len(state),
+            "State (KB)": round(deep_size(state) / 1024, 1),
+        })
+
+    shared = {
+        "Kataloger (områder)": _shard_cache()["entries"],
+        "Katalog-snapshot": _snapshot_holder()["catalogs"],
+        "Ændringsbus": {k: v for k, v in get_change_bus().items() if k != "lock"},
+        "Statistik": get_catalog_stats()["catalogs"],
+        "Historik": load_history(),
+        "Koordinater": load_coordinates(),
+    }
+    caches = [{"Cache": name, "Størrelse (KB)": round(deep_size(obj) / 1024, 1)} for name, obj in shared.items()]
+
+    lines, traced = [], None
+    if tracemalloc.is_tracing():
+        current, peak = tracemalloc.get_traced_memory()
+        traced = {"current_mb": round(current / 2**20, 1), "peak_mb": round(peak / 2**20, 1)}
+        for stat in tracemalloc.take_snapshot().statistics("lineno")[:MEMORY_TOP_LINES]:
+            frame = stat.traceback[0]
+            lines.append({
+                "Kodelinje": f"{Path(frame.filename).name}:{frame.lineno}",
+                "Størrelse (KB)": round(stat.size / 1024, 1),
+                "Allokeringer": stat.count,
+            })
+
+    return {
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "sessions": sessions,
+        "evicted_sessions": evicted,
+        "trimmed_keys": trimmed,
+        "caches": caches,
+        "traced": traced,
+        "lines": lines,
+    }
@@ -6,21 +6,28 @@
 # Må ikke kopieres, distribueres, modificeres, sælges eller på anden måde anvendes kommercielt eller deles offentligt
 # uden skriftlig tilladelse fra FairPool v/Tommy Christensen.
 
+import json
+import zipfile
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
 import streamlit as st
-import gspread
 import requests
-from oauth2client.service_account import ServiceAccountCredentials
 from streamlit_cookies_manager import EncryptedCookieManager
 
-# ────────────────────────────────────────────────
-# Cookie manager (til at huske login på tværs af genindlæsninger)
-# ────────────────────────────────────────────────
-cookies = EncryptedCookieManager(
-    prefix="fairpool/",
-    password=st.secrets["cookies"]["password"],
+from fairpool_core import (
+    CHANGE_POLL_SECONDS, FORECAST_MAX_DAYS, FORECAST_MIN_CL, FORECAST_PH_MAX, FORECAST_PH_MIN,
+    POOL_TARGET_CL_LEAVE, SESSION_IDLE_SECONDS, SESSION_MAX_BYTES, SPA_FYLDES_STYLE, SPA_TOMNING_STYLE,
+    STICK_DAYS, add_measurement, add_pool, batch_dosing, build_fleet_frame, build_route_points,
+    build_spatial_index, catalog_changes_since, clear_if_evicted, dosing_summary, export_catalogs,
+    forecast_fleet, get_catalog_snapshot, get_change_bus, get_shard_sheet, import_catalog_rows, is_admin,
+    load_coordinates, load_history, load_pools, load_shard_catalog, load_spas, memory_report, plan_route,
+    pool_dosing, prewarm_caches, query_nearby, read_import_file, route_length_km, save_coordinates,
+    shard_has, shards_for_email, spa_dosing, spa_record, start_catalog_refresher, start_change_watcher,
+    start_health_server, start_memory_tracing, sweep_idle_sessions, track_session, validate_import,
+    van_stock,
 )
-if not cookies.ready():
-    st.stop()
 
 # ────────────────────────────────────────────────
 # Firebase Authentication (API key fra secrets)
@@ -145,119 +152,40 @@ def show_set_password():
             else:
                 st.error(f"Kunne ikke gemme adgangskode: {err}")
 
-
 # ────────────────────────────────────────────────
-# Google Sheets opsætning
+# Fælles visning – ændringsbanner og lyst tema
 # ────────────────────────────────────────────────
-POOL_SHEET_ID = "1J7hqPcK7rpRwrjaYAhKh5jDpk8tNYKhfM3_7FWCY2rA"
-POOL_WORKSHEET_NAME = "Sheet1"
-
-SPA_SHEET_ID = "16PLyJjec6WX-6Z5SQD1B_tl8qZYObKRx5Nt9ZRBHgRU"
-SPA_WORKSHEET_NAME = "Sheet1"
-
-scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
+@st.fragment(run_every=CHANGE_POLL_SECONDS)
+def catalog_change_notice(shard_names, kinds):
+    # Fragmentet kører i sessionens egen tråd – også når teknikeren ikke rører siden
+    if clear_if_evicted() or "auth_token" not in st.session_state:
+        return
+    get_catalog_snapshot()   # pakker en ny snapshot-version ud, hvis refresheren har skrevet en
+    seen = st.session_state.get("catalog_version", 0)
+    changes = catalog_changes_since(seen, shard_names, kinds)
+    if not changes:
+        return
 
-@st.cache_resource
-def get_sheets_client():
-    creds = ServiceAccountCredentials.from_json_keyfile_dict(st.secrets["gcp_service_account"], scope)
-    return gspread.authorize(creds)
-
-@st.cache_resource
-def get_pool_sheet():
-    return get_sheets_client().open_by_key(POOL_SHEET_ID).worksheet(POOL_WORKSHEET_NAME)
-
-@st.cache_resource
-def get_spa_sheet():
-    return get_sheets_client().open_by_key(SPA_SHEET_ID).worksheet(SPA_WORKSHEET_NAME)
-
-# ────────────────────────────────────────────────
-# Load funktioner
-# ────────────────────────────────────────────────
-@st.cache_data(ttl=300)
-def load_pools():
-    values = get_pool_sheet().get_all_values()
-    if not values:
-        return {}, {}
- 
-    headers = [h.strip() for h in values[0]] if values else []
- 
-    pools = {}
-    pool_info = {}
- 
-    for row in values[1:]:
-        if not row or not row[0].strip(): continue
-     
-        name = row[0].strip()
-        if not name or name.startswith("-"): continue
-     
-        vol_idx = headers.index("Volumen (m3)") if "Volumen (m3)" in headers else 1
-        vol_str = row[vol_idx] if vol_idx < len(row) else "0"
-        try:
-            vol = float(vol_str)
-        except (ValueError, TypeError):
-            vol = 0.0
-     
-        pools[name] = vol
-     
-        extra = {}
-        adresse_idx = headers.index("Adresse") if "Adresse" in headers else 2
-        pumpetype_idx = headers.index("Pumpetype") if "Pumpetype" in headers else 3
-        returskyl_idx = headers.index("Returskyl (5 min)") if "Returskyl (5 min)" in headers else 4
-        nøglebokskode_idx = headers.index("Nøglebokskode") if "Nøglebokskode" in headers else 5
-        he_idx = headers.index("HE telefonnummer") if "HE telefonnummer" in headers else 6
-        instruktioner_idx = headers.index("Instruktioner") if "Instruktioner" in headers else None
-     
-        if adresse_idx < len(row): extra["Adresse"] = row[adresse_idx] or "Ikke angivet"
-        if pumpetype_idx < len(row): extra["Pumpetype"] = row[pumpetype_idx] or "Ikke angivet"
-        if returskyl_idx < len(row) and row[returskyl_idx]:
-            try:
-                liter = float(row[returskyl_idx])
-                kubik = liter / 1000
-                extra["Returskyl (5 min)"] = f"{int(liter)} liter / {kubik:.1f} m³"
-            except (ValueError):
-                extra["Returskyl (5 min)"] = row[returskyl_idx]
-        else:
-            extra["Returskyl (5 min)"] = "Ikke angivet"
-        if nøglebokskode_idx < len(row): extra["Nøglebokskode"] = row[nøglebokskode_idx] or "Ikke angivet"
-        if he_idx < len(row): extra["HE telefonnummer"] = row[he_idx] or "Ikke angivet"
-        if instruktioner_idx is not None and instruktioner_idx < len(row):
-            extra["Instruktioner"] = row[instruktioner_idx] or ""
-     
-        pool_info[name] = extra
- 
-    return pools, pool_info
-
-
-@st.cache_data(ttl=300)
-def load_spas():
-    values = get_spa_sheet().get_all_values()
-    if not values or len(values) < 1:
-        return []
-    
-    headers = [h.strip() for h in values[0]]
-    
-    spas = []
-    for row in values[1:]:
-        if not row or not row[0].strip():
-            continue
-            
-        spa_dict = {}
-        for i, header in enumerate(headers):
-            if i < len(row):
-                spa_dict[header] = str(row[i]).strip() if row[i] else "Ikke angivet"
-            else:
-                spa_dict[header] = "Ikke angivet"
-        
-        display_name = f"{spa_dict.get('ObjektNummer', '')} - {spa_dict.get('Adresse', '')}".strip(" -")
-        if display_name:
-            spa_dict['display_name'] = display_name
-            spas.append(spa_dict)
-    
-    return spas
+    latest = max(c["version"] for c in changes)
+    changed_keys = list(dict.fromkeys(c["key"] for c in changes))
+    if st.session_state.get("current_object") in changed_keys:
+        # Objektet teknikeren står ved er ændret (fx nøglekode) – vis de nye data med det samme
+        st.session_state["catalog_version"] = latest
+        st.toast(f"🔔 {st.session_state['current_object']} er opdateret")
+        st.rerun()
 
+    if st.session_state.get("catalog_notified") != latest:
+        st.session_state["catalog_notified"] = latest
+        st.toast("🔔 Kataloget er opdateret")
+    details = "; ".join(
+        f"{c['key']} ({', '.join(c['fields'])})" for c in changes[-3:]
+    )
+    more = f" og {len(changed_keys) - 3} flere" if len(changed_keys) > 3 else ""
+    st.info(f"🔔 Nye data: {details}{more}")
+    if st.button("Vis nye data", key="catalog_refresh"):
+        st.session_state["catalog_version"] = latest
+        st.rerun()
 
-def add_pool(name, vol):
-    get_pool_sheet().append_row([name, vol, "", name, "", "", ""])
 
 def force_light_mode():
     st.markdown(
@@ -272,6 +200,29 @@ def force_light_mode():
         unsafe_allow_html=True
     )
 
+# ────────────────────────────────────────────────
+# Baggrundsjob – startes af serve.py ved processtart, ellers ved første kørsel, før login og cookies.
+# Alle er cache_resource, så kaldene her er gratis når de allerede kører.
+# ────────────────────────────────────────────────
+start_catalog_refresher()
+start_change_watcher()
+prewarm_caches()
+start_health_server()
+start_memory_tracing()
+
+# ────────────────────────────────────────────────
+# Cookie manager (til at huske login på tværs af genindlæsninger)
+# ────────────────────────────────────────────────
+cookies = EncryptedCookieManager(
+    prefix="fairpool/",
+    password=st.secrets["cookies"]["password"],
+)
+if not cookies.ready():
+    st.stop()
+
+track_session()
+sweep_idle_sessions()
+
 # ────────────────────────────────────────────────
 # Login gate
 # ────────────────────────────────────────────────
@@ -325,12 +276,27 @@ if st.session_state.service_type is None:
             st.session_state.service_type = "spa"
             st.rerun()
     
+    if st.button("🗓️ Planlægning – næste besøg", use_container_width=True):
+        st.session_state.service_type = "plan"
+        st.rerun()
+
+    if is_admin(st.session_state.get("auth_email", "")):
+        if st.button("🛠️ Admin – hukommelse og sessioner", use_container_width=True):
+            st.session_state.service_type = "admin"
+            st.rerun()
+    
     st.stop()
 
 # ────────────────────────────────────────────────
 # Hoved-app
 # ────────────────────────────────────────────────
 service_type = st.session_state.service_type
+technician_shards = shards_for_email(st.session_state.get("auth_email", ""))
+# Læses før katalogerne, så ændringer udgivet under denne kørsel stadig vises som nye
+loaded_catalog_version = get_change_bus()["version"]
+if not technician_shards and service_type != "admin":
+    st.error("Din email er ikke tilknyttet et område endnu – kontakt kontoret.")
+    st.stop()
 
 if service_type == "pool":
     # ==================== POOL DEL ====================
@@ -341,11 +307,12 @@ if service_type == "pool":
     with col_logo:
         st.image("https://iili.io/qai6KmJ.jpg", width=180)
     
-    pools, pool_info = load_pools()
+    pools, pool_info = load_pools(technician_shards)
     pool_list = list(pools.keys())
     
     if pool_list:
         selected = st.selectbox("Vælg pool fra listen", pool_list)
+        st.session_state["current_object"] = selected
         volume = pools[selected]
         info = pool_info.get(selected, {})
     else:
@@ -360,10 +327,16 @@ if service_type == "pool":
             new_name = st.text_input("Nyt pool-navn")
         with col2:
             new_vol = st.number_input("Volumen (m³)", min_value=0.0, value=0.0, step=1.0)
+        pool_shards = [s for s in technician_shards if shard_has(s, "pools")]
+        new_shard = pool_shards[0] if pool_shards else None
+        if len(pool_shards) > 1:
+            new_shard = st.selectbox("Område", pool_shards, format_func=lambda s: s["name"])
      
         if st.button("Gem ny pool"):
-            if new_name.strip():
-                add_pool(new_name.strip(), new_vol)
+            if new_shard is None:
+                st.error("Dit område har ingen pool-fane i Google Sheet")
+            elif new_name.strip():
+                add_pool(new_name.strip(), new_vol, new_shard)
                 st.success(f"{new_name.strip()} tilføjet til Google Sheet (Adresse sat til samme som navn)")
                 st.rerun()
             else:
@@ -461,34 +434,12 @@ if service_type == "pool":
             help="Du skal vælge 1 eller 2 – 0 er ikke muligt når feltet er afkrydset"
         )
     
-    target_ph = 7.0
-    target_cl_leave = 4.0
-    target_cl_maintenance = 5.5 if leased == "Udlejet" else 3.8
-    target_klor_op = 6.0 if current_cl <= 0.3 else 4.0
-    delta_cl_leave = max(0, target_klor_op - current_cl)
-    new_cl_after_leave = current_cl + delta_cl_leave
-    delta_cl_maint = 0.0
-    sticks_needed = 0.0
-    ph_rise_from_sticks = 0.0
-    
-    if not has_existing_stick and leased == "Udlejet":
-        if new_cl_after_leave <= 4.0:
-            delta_cl_maint = max(0, target_cl_maintenance - new_cl_after_leave)
-            if delta_cl_maint > 0:
-                klor_per_stick_25m3 = 8.0
-                raise_here = klor_per_stick_25m3 * (25.0 / volume)
-                sticks_needed = delta_cl_maint / raise_here
-                sticks_needed = max(1, round(sticks_needed))
-                ph_rise_from_sticks = 0.4 * sticks_needed * (25.0 / volume)
-            else:
-                sticks_needed = 1
-                ph_rise_from_sticks = 0.4 * sticks_needed * (25.0 / volume)
-        else:
-            sticks_needed = 0
-    
-    ph_rise_from_briqs = delta_cl_leave * 0.05
-    total_ph_rise_from_klor = ph_rise_from_briqs + ph_rise_from_sticks
-    expected_ph_after_klor = current_ph + total_ph_rise_from_klor
+    dosing = pool_dosing(volume, current_ph, current_cl, leased == "Udlejet", has_existing_stick)
+    target_klor_op = dosing["target_klor_op"]
+    delta_cl_leave = dosing["delta_cl_leave"]
+    new_cl_after_leave = dosing["new_cl_after_leave"]
+    sticks_needed = dosing["sticks_needed"]
+    ph_rise_from_sticks = dosing["ph_rise_from_sticks"]
     
     st.markdown(
         """
@@ -504,39 +455,28 @@ if service_type == "pool":
     
     st.header("Anbefalet dosering")
     
-    if current_ph > 7.0 or expected_ph_after_klor > 7.0:
-        delta_to_reduce = max(current_ph - target_ph, expected_ph_after_klor - target_ph)
-        ml_minus = 35 * delta_to_reduce * volume
-        st.subheader(f"Sænk pH med {delta_to_reduce:.2f} (efter klor)")
-        st.markdown(f"**pH-minus → {ml_minus:.0f} ml**")
-    elif current_ph < 7.0 and expected_ph_after_klor < 7.0:
-        delta_to_raise = target_ph - expected_ph_after_klor
-        ml_plus = 49 * delta_to_raise * volume
-        st.subheader(f"Hæv pH med {delta_to_raise:.2f} (efter klor)")
-        st.markdown(f"**pH-plus → {ml_plus:.0f} ml**")
+    if dosing["ph_action"] == "minus":
+        st.subheader(f"Sænk pH med {dosing['ph_delta']:.2f} (efter klor)")
+        st.markdown(f"**pH-minus → {dosing['ph_minus_ml']:.0f} ml**")
+    elif dosing["ph_action"] == "plus":
+        st.subheader(f"Hæv pH med {dosing['ph_delta']:.2f} (efter klor)")
+        st.markdown(f"**pH-plus → {dosing['ph_plus_ml']:.0f} ml**")
     else:
         st.success("pH er på eller tæt på målet efter klor – ingen PH-justering nødvendig")
     
     if current_cl > 6.0:
-        mg_to_lower = current_cl - target_cl_leave
-        antiklor_per_m3_per_mg = 0.83
-        antiklor_total = antiklor_per_m3_per_mg * mg_to_lower * volume
-     
         st.subheader(f"Sænkning af klor (for højt: {current_cl:.1f} mg/l)")
-        st.markdown(f"**Anti-klor: {antiklor_total:.0f} gram/ml**")
-        st.caption(f"→ sænker klor fra {current_cl:.1f} mg/l til {target_cl_leave} mg/l")
+        st.markdown(f"**Anti-klor: {dosing['antiklor']:.0f} gram/ml**")
+        st.caption(f"→ sænker klor fra {current_cl:.1f} mg/l til {POOL_TARGET_CL_LEAVE} mg/l")
         st.warning("Vent 1-2 timer efter antiklor, mål igen før yderligere klor-tilsætning!")
     else:
         if delta_cl_leave < 0.3:
             st.info("Klor OK ved afgang - ingen Briquetter/Daytabs nødvendige")
         else:
-            briqs = 0.21 * delta_cl_leave * volume
-            briqs_round = round(briqs)
-            new_cl = current_cl + delta_cl_leave
-         
+            briqs = dosing["briqs"]
             st.subheader(f"Opkloring til {target_klor_op} mg/l ved afgang")
-            st.markdown(f"**HTH Briquetter/Daytabs: {briqs:.1f} stk → afrund til {briqs_round} stk**")
-            st.caption(f"→ doserer klor fra {current_cl:.1f} mg/l til {new_cl:.1f} mg/l")
+            st.markdown(f"**HTH Briquetter/Daytabs: {briqs:.1f} stk → afrund til {round(briqs)} stk**")
+            st.caption(f"→ doserer klor fra {current_cl:.1f} mg/l til {new_cl_after_leave:.1f} mg/l")
     
     st.subheader("Vedligehold - Tempo Sticks (5-7 dage)")
     if has_existing_stick:
@@ -544,13 +484,345 @@ if service_type == "pool":
     elif leased == "Ikke udlejet":
         st.info("Huset er ikke udlejet → ingen Tempo Sticks nødvendige")
     elif new_cl_after_leave <= 4.0:
-        added_cl = sticks_needed * 8.0 * (25.0 / volume)
+        added_cl = dosing["added_cl_sticks"]
         st.markdown(f"**HTH Tempo Sticks: {sticks_needed} stk**")
         st.caption(f"→ giver ca. +{added_cl:.1f} mg/l klor og +{ph_rise_from_sticks:.2f} pH-stigning")
         st.caption("Tempo Sticks skal altid placeres i KLORINATOREN eller i SKIMMEREN via en Tempo Stick Dispenser - aldrig direkte i skimmeren eller poolen!")
     else:
         st.info("Klor efter opkloring er over 4.0 mg/l – ingen nye Tempo Sticks nødvendige til vedligehold.")
 
+    # Prognose for næste besøg ud fra doseringen ovenfor
+    sticks_after_visit = existing_sticks if has_existing_stick else int(sticks_needed)
+    visit_forecast = forecast_fleet(pd.DataFrame([{
+        "Type": "pool", "Objekt": selected, "Volumen (m³)": volume,
+        "Udlejet": leased == "Udlejet", "Sticks": sticks_after_visit,
+        "Sidste besøg": date.today(), "Sidste klor": current_cl,
+        "Klorforbrug": np.nan, "pH-drift": np.nan,
+    }]))
+    next_row = visit_forecast.iloc[0]
+    st.caption(f"Prognose: næste besøg om ca. {next_row['Dage til besøg']} dage "
+               f"({next_row['Næste besøg']:%d-%m}) – {next_row['Årsag'].lower()}")
+
+    if st.button("📝 Gem måling i historik"):
+        add_measurement("pool", selected, current_ph, current_cl, leased == "Udlejet", sticks_after_visit)
+        st.success("Målingen er gemt – den bruges til prognoser i Planlægning.")
+
+elif service_type == "plan":
+    # ==================== PLANLÆGNING ====================
+    st.set_page_config(page_title="FairPool – Planlægning", layout="wide")
+    force_light_mode()
+
+    col_logo, _ = st.columns([1, 5])
+    with col_logo:
+        st.image("https://iili.io/qai6KmJ.jpg", width=180)
+
+    st.title("🗓️ Planlægning")
+
+    pools, pool_info = load_pools(technician_shards)
+    spas = load_spas(technician_shards)
+    if spas["problems"]:
+        with st.expander(f"⚠️ {len(spas['problems'])} fejl i SPA-sheetet – ret dem i Google Sheet", expanded=False):
+            st.dataframe(pd.DataFrame(spas["problems"]), hide_index=True, use_container_width=True)
+    fleet = build_fleet_frame(pools, spas, load_history())
+
+    tab_schedule, tab_route, tab_van, tab_catalog = st.tabs(["Næste besøg", "Rute", "Varebil", "Import / eksport"])
+    with tab_schedule:
+        st.markdown(
+            f"Prognosen fremskriver frit klor og pH fra sidste besøg. Et objekt skal besøges når klor "
+            f"forventes under **{FORECAST_MIN_CL} mg/l**, pH uden for **{FORECAST_PH_MIN}–{FORECAST_PH_MAX}**, "
+            f"eller senest efter **{FORECAST_MAX_DAYS} dage**. Ret udlejning, sticks og sidste besøg herunder – "
+            f"planen regnes om med det samme."
+        )
+        edited = st.data_editor(
+            fleet[["Type", "Objekt", "Volumen (m³)", "Udlejet", "Sticks", "Sidste besøg", "Historik"]],
+            column_config={
+                "Volumen (m³)": st.column_config.NumberColumn(format="%.1f"),
+                "Sticks": st.column_config.NumberColumn("Sticks / Tab Twenty", min_value=0, step=1),
+                "Sidste besøg": st.column_config.DateColumn(format="DD-MM-YYYY"),
+            },
+            disabled=["Type", "Objekt", "Volumen (m³)", "Historik"],
+            hide_index=True,
+            use_container_width=True,
+            key="plan_fleet",
+        )
+        planned_fleet = fleet.assign(**{
+            "Udlejet": edited["Udlejet"],
+            "Sticks": edited["Sticks"],
+            "Sidste besøg": edited["Sidste besøg"],
+        })
+        schedule = forecast_fleet(planned_fleet)
+
+        due_count = int((schedule["Dage til besøg"] <= 0).sum())
+        if due_count:
+            st.warning(f"{due_count} objekt(er) bør besøges i dag eller er overskredet.")
+        st.dataframe(
+            schedule[["Næste besøg", "Dage til besøg", "Type", "Objekt", "Forventet klor nu",
+                      "Forventet pH nu", "Årsag", "Historik"]],
+            column_config={"Næste besøg": st.column_config.DateColumn(format="DD-MM-YYYY")},
+            hide_index=True,
+            use_container_width=True,
+        )
+
+    with tab_route:
+        points = build_route_points(pools, pool_info, spas, load_coordinates())
+
+        missing = points.loc[points["Breddegrad"].isna(), ["Adresse"]].drop_duplicates()
+        if not missing.empty:
+            with st.expander(f"📍 {len(missing)} adresse(r) mangler koordinater", expanded=False):
+                st.caption("Koordinaterne gemmes i den lokale koordinatfil og skal kun indtastes én gang pr. adresse.")
+                entered = st.data_editor(
+                    missing.assign(Breddegrad=np.nan, Længdegrad=np.nan),
+                    column_config={
+                        "Breddegrad": st.column_config.NumberColumn(format="%.5f"),
+                        "Længdegrad": st.column_config.NumberColumn(format="%.5f"),
+                    },
+                    disabled=["Adresse"],
+                    hide_index=True,
+                    use_container_width=True,
+                    key="route_missing_coords",
+                )
+                if st.button("Gem koordinater"):
+                    save_coordinates(entered)
+                    st.rerun()
+
+        route_date = st.date_input("Dato for ruten", value=date.today(), format="DD-MM-YYYY")
+        forecast_on_date = forecast_fleet(planned_fleet, today=route_date)
+        due_on_date = forecast_on_date.loc[forecast_on_date["Dage til besøg"] <= 0, "Objekt"].tolist()
+        stops = st.multiselect("Dagens besøg (forudfyldt med objekter der forfalder)",
+                               points["Objekt"].tolist(), default=due_on_date)
+
+        if stops:
+            chosen = points[points["Objekt"].isin(stops)]
+            located = chosen[chosen["Breddegrad"].notna()].reset_index(drop=True)
+            start_name = st.selectbox("Start ved", located["Objekt"].tolist() or ["—"])
+
+            if not located.empty:
+                start = int(located.index[located["Objekt"] == start_name][0])
+                order = plan_route(located["Breddegrad"], located["Længdegrad"], start)
+                route = located.iloc[order].assign(**{
+                    "Km fra forrige": route_length_km(located["Breddegrad"], located["Længdegrad"], order).round(1)
+                })
+            else:
+                route = located.assign(**{"Km fra forrige": []})
+            route = pd.concat([route, chosen[chosen["Breddegrad"].isna()]], ignore_index=True)
+            route.insert(0, "Nr", range(1, len(route) + 1))
+
+            expected = forecast_on_date[["Type", "Objekt", "Udlejet", "Forventet klor nu", "Forventet pH nu"]]
+            route = route.merge(expected.drop_duplicates(["Type", "Objekt"]), on=["Type", "Objekt"], how="left")
+            route = route.rename(columns={"Forventet klor nu": "Forventet klor", "Forventet pH nu": "Forventet pH"})
+            route["Dosering (forventet)"] = [
+                dosing_summary(t, v, ph, cl, leased)
+                for t, v, ph, cl, leased in zip(route["Type"], route["Volumen (m³)"], route["Forventet pH"],
+                                                route["Forventet klor"], route["Udlejet"])
+            ]
+
+            st.metric("Samlet køreafstand (fugleflugt)", f"{route['Km fra forrige'].sum():.1f} km")
+            if chosen["Breddegrad"].isna().any():
+                st.caption("Objekter uden koordinater står sidst på listen.")
+            checklist = route[["Nr", "Type", "Objekt", "Adresse", "Kode", "Km fra forrige",
+                               "Forventet klor", "Forventet pH", "Dosering (forventet)"]]
+            st.dataframe(checklist, hide_index=True, use_container_width=True)
+            st.download_button(
+                "⬇️ Hent tjekliste (CSV)",
+                checklist.to_csv(index=False, sep=";").encode("utf-8-sig"),
+                file_name=f"rute_{route_date:%Y-%m-%d}.csv",
+                mime="text/csv",
+            )
+
+        st.subheader("Objekter tæt på")
+        located_all = points[points["Breddegrad"].notna()].reset_index(drop=True)
+        if located_all.empty:
+            st.info("Ingen objekter har koordinater endnu.")
+        else:
+            col_near, col_radius = st.columns([3, 1])
+            with col_near:
+                here = st.selectbox("Jeg står ved", located_all["Objekt"].tolist(), key="route_here")
+            with col_radius:
+                radius = st.number_input("Radius (km)", min_value=0.5, value=5.0, step=0.5)
+            index = build_spatial_index(located_all["Breddegrad"], located_all["Længdegrad"])
+            here_row = located_all[located_all["Objekt"] == here].iloc[0]
+            near_ids, near_km = query_nearby(index, here_row["Breddegrad"], here_row["Længdegrad"], radius)
+            nearby = located_all.iloc[near_ids].assign(Km=near_km.round(1))
+            st.dataframe(nearby[["Km", "Type", "Objekt", "Adresse", "Kode"]], hide_index=True,
+                         use_container_width=True)
+
+    with tab_van:
+        st.markdown(
+            "Vælg dagens pools og SPA'er. Doseringsreglerne køres for dem alle på én gang, og behovet "
+            "lægges sammen til en læsseliste. Ret klor, pH og vandskift pr. objekt i tabellen."
+        )
+        col_date, col_readings, col_margin = st.columns([1, 2, 2])
+        with col_date:
+            van_date = st.date_input("Dato", value=date.today(), format="DD-MM-YYYY", key="van_date")
+        with col_readings:
+            readings = st.radio("Værdier", ["Forventet (prognose)", "Sidst målt"], horizontal=True)
+        with col_margin:
+            margin = st.slider("Sikkerhedsmargin (%)", min_value=0, max_value=50, value=15, step=5)
+
+        van_fleet = forecast_fleet(planned_fleet, today=van_date)
+        van_labels = np.where(van_fleet["Type"] == "spa", "🛁 ", "🏊 ") + van_fleet["Objekt"]
+        van_stops = st.multiselect(
+            "Dagens besøg (forudfyldt med objekter der forfalder)",
+            list(dict.fromkeys(van_labels)),
+            default=list(dict.fromkeys(van_labels[van_fleet["Dage til besøg"] <= 0])),
+            key="van_stops",
+        )
+
+        if van_stops:
+            chosen = van_fleet[np.isin(van_labels, van_stops)]
+            if readings == "Sidst målt":
+                cl_now = chosen["Sidste klor"].fillna(chosen["Forventet klor nu"])
+                ph_now = chosen["Sidste pH"].fillna(chosen["Forventet pH nu"])
+            else:
+                cl_now, ph_now = chosen["Forventet klor nu"], chosen["Forventet pH nu"]
+            days_since = (pd.Timestamp(van_date) - pd.to_datetime(chosen["Sidste besøg"])).dt.days
+            van_plan = st.data_editor(
+                chosen[["Type", "Objekt", "Volumen (m³)", "Udlejet"]].assign(**{
+                    "Klor": cl_now.round(1),
+                    "pH": ph_now.round(1),
+                    "Stick i vandet": (chosen["Sticks"] > 0) & (days_since < STICK_DAYS),
+                    "Vandskift": False,
+                }),
+                column_config={
+                    "Volumen (m³)": st.column_config.NumberColumn(format="%.1f"),
+                    "Klor": st.column_config.NumberColumn(min_value=0.0, step=0.1, format="%.1f"),
+                    "pH": st.column_config.NumberColumn(min_value=0.0, max_value=14.0, step=0.1, format="%.1f"),
+                    "Vandskift": st.column_config.CheckboxColumn(help="Kun SPA – tæller Pipe Cleaner og kemi til frisk vand"),
+                },
+                disabled=["Type", "Objekt", "Volumen (m³)"],
+                hide_index=True,
+                use_container_width=True,
+                key="van_plan",
+            )
+            # En tømt celle må ikke give 0 i behov – brug den forudfyldte værdi
+            cleared = van_plan["Klor"].isna() | van_plan["pH"].isna()
+            if cleared.any():
+                st.warning(f"Tom klor/pH for {', '.join(van_plan.loc[cleared, 'Objekt'])} – "
+                           f"regner med den forudfyldte værdi ({readings.lower()}).")
+            van_plan["Klor"] = van_plan["Klor"].fillna(cl_now.round(1))
+            van_plan["pH"] = van_plan["pH"].fillna(ph_now.round(1))
+            doses = batch_dosing(chosen.assign(**{
+                col: van_plan[col].to_numpy() for col in ["Udlejet", "Klor", "pH", "Stick i vandet", "Vandskift"]
+            }))
+            stock = van_stock(doses, margin / 100)
+
+            st.subheader(f"Læsseliste – {len(chosen)} besøg")
+            st.dataframe(stock[stock["Behov"] > 0], hide_index=True, use_container_width=True)
+            st.caption("Behovet er summen af doseringen pr. objekt. Med margin er rundet op til hele enheder.")
+            st.download_button(
+                "⬇️ Hent læsseliste (CSV)",
+                stock.to_csv(index=False, sep=";").encode("utf-8-sig"),
+                file_name=f"varebil_{van_date:%Y-%m-%d}.csv",
+                mime="text/csv",
+            )
+            with st.expander("Dosering pr. objekt", expanded=False):
+                per_object = pd.concat([chosen[["Type", "Objekt"]], doses.round(0)], axis=1)
+                st.dataframe(per_object.loc[:, (per_object != 0).any()], hide_index=True, use_container_width=True)
+
+    with tab_catalog:
+        catalog_shard = technician_shards[0]
+        if len(technician_shards) > 1:
+            catalog_shard = st.selectbox("Område", technician_shards, format_func=lambda s: s["name"],
+                                         key="catalog_shard")
+
+        st.subheader("Masseimport")
+        import_label = st.radio("Katalog", ["Pools", "SPA'er"], horizontal=True, key="import_kind")
+        import_kind = "pool" if import_label == "Pools" else "spa"
+        uploaded = None
+        if not shard_has(catalog_shard, f"{import_kind}s"):
+            st.info(f"Området {catalog_shard['name']} har ingen fane til {import_label.lower()}.")
+        else:
+            sheet_headers = get_shard_sheet(catalog_shard, f"{import_kind}s").row_values(1)
+            if not any(h.strip() for h in sheet_headers):
+                st.error("Fanen har ingen kolonneoverskrifter i række 1 – tilføj dem i Google Sheet før import.")
+            else:
+                st.caption("Filen skal have samme kolonneoverskrifter som sheetet: " + ", ".join(sheet_headers))
+                uploaded = st.file_uploader("CSV-, Excel-, Parquet- eller eksport-zip-fil",
+                                            type=["csv", "xlsx", "parquet", "zip"])
+        if uploaded is not None:
+            try:
+                import_frame = read_import_file(uploaded, import_kind)
+            except (ValueError, KeyError, zipfile.BadZipFile) as exc:
+                st.error(f"Kunne ikke læse filen: {exc}")
+                import_frame = None
+
+            if import_frame is not None:
+                shard_catalog = load_shard_catalog(catalog_shard, f"{import_kind}s")
+                existing = shard_catalog[0].keys() if import_kind == "pool" else shard_catalog["display_name"]
+                import_rows, import_problems = validate_import(import_frame, sheet_headers, import_kind, existing)
+                if import_problems:
+                    st.warning(f"{len(import_problems)} problem(er) – rækker med fejl springes over.")
+                    st.dataframe(pd.DataFrame(import_problems), hide_index=True, use_container_width=True)
+                if import_rows:
+                    st.dataframe(pd.DataFrame(import_rows, columns=sheet_headers), hide_index=True,
+                                 use_container_width=True)
+                    if st.button(f"Importér {len(import_rows)} rækker", type="primary"):
+                        import_catalog_rows(catalog_shard, import_kind, import_rows)
+                        st.success(f"{len(import_rows)} rækker er tilføjet til Google Sheet.")
+                else:
+                    st.info("Ingen gyldige rækker at importere.")
+
+        st.subheader("Eksport")
+        st.caption("Begge kataloger som komprimerede Parquet-filer – til analyse eller til at fylde en ny installation.")
+        if st.button("Forbered eksport"):
+            st.download_button(
+                "⬇️ Hent kataloger (zip med Parquet)",
+                export_catalogs(catalog_shard["name"]),
+                file_name=f"fairpool_katalog_{catalog_shard['name']}_{date.today():%Y-%m-%d}.zip",
+                mime="application/zip",
+            )
+
+elif service_type == "admin":
+    # ==================== ADMIN ====================
+    st.set_page_config(page_title="FairPool – Admin", layout="wide")
+    force_light_mode()
+
+    if not is_admin(st.session_state.get("auth_email", "")):
+        st.error("Du har ikke adgang til admin-siden.")
+        st.stop()
+
+    st.title("🛠️ Hukommelse og sessioner")
+
+    if st.button("Ryd inaktive sessioner nu"):
+        st.success(f"{sweep_idle_sessions(force=True)} inaktive sessioner er markeret – de rydder selv "
+                   f"deres state inden for {CHANGE_POLL_SECONDS} sekunder, eller når de bruges igen.")
+
+    report = memory_report()
+    sessions = pd.DataFrame(report["sessions"])
+
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Aktive sessioner", len(sessions))
+    col2.metric("Session-state i alt", f"{sessions['State (KB)'].sum() if len(sessions) else 0:.0f} KB")
+    col3.metric("Ryddet (inaktive)", report["evicted_sessions"])
+    col4.metric("Beskårne nøgler", report["trimmed_keys"])
+    st.caption(
+        (f"Inaktive sessioner ryddes efter {SESSION_IDLE_SECONDS / 60:.0f} min" if SESSION_IDLE_SECONDS
+         else "Inaktive sessioner ryddes ikke (idle_minutes)")
+        + " · "
+        + (f"maks. {SESSION_MAX_BYTES // 1024} KB state pr. session" if SESSION_MAX_BYTES
+           else "ingen grænse for state pr. session (max_session_kb)")
+    )
+
+    st.subheader("Sessioner")
+    st.dataframe(sessions, hide_index=True, use_container_width=True)
+
+    st.subheader("Delte caches")
+    st.dataframe(pd.DataFrame(report["caches"]), hide_index=True, use_container_width=True)
+
+    st.subheader("Allokeringer (tracemalloc)")
+    if report["traced"] is None:
+        st.info("tracemalloc er slået fra – sæt `trace_memory = true` under [admin] i secrets.")
+    else:
+        st.caption(f"Sporet nu: {report['traced']['current_mb']} MB · top: {report['traced']['peak_mb']} MB")
+        st.dataframe(pd.DataFrame(report["lines"]), hide_index=True, use_container_width=True)
+
+    st.download_button(
+        "⬇️ Hent rapport (JSON)",
+        json.dumps(report, ensure_ascii=False, indent=2).encode("utf-8"),
+        file_name=f"fairpool_hukommelse_{datetime.now():%Y-%m-%d_%H%M}.json",
+        mime="application/json",
+    )
+
 else:  # ==================== SPA DEL ====================
     st.set_page_config(page_title="SPA Dosering", layout="wide")
     force_light_mode()
@@ -581,30 +853,29 @@ else:  # ==================== SPA DEL ====================
         )
     # ─────────────────────────────────────────────────────────────────────────
 
-    spas = load_spas()
+    spas = load_spas(technician_shards)
     
-    if not spas:
+    if not spas["display_name"]:
         st.error("Ingen SPA'er fundet i Google Sheet.")
         st.stop()
     
-    spa_options = [spa['display_name'] for spa in spas]
-    selected_spa_display = st.selectbox("Vælg SPA fra listen", spa_options)
+    selected_spa_display = st.selectbox("Vælg SPA fra listen", spas["display_name"])
+    st.session_state["current_object"] = selected_spa_display
     
-    selected_spa = next((spa for spa in spas if spa['display_name'] == selected_spa_display), None)
+    selected_spa = spa_record(spas, spas["index"][selected_spa_display])
     
     if selected_spa:
-        st.header(selected_spa.get('Adresse', 'SPA'))
+        st.header(selected_spa['Adresse'] or 'SPA')
         
         # Vis felter – kun hvis der er data
         fields = [
-            ("ObjektNummer", selected_spa.get('ObjektNummer', '')),
-            ("Model",        selected_spa.get('Model', '')),
-            ("NøgleKode",    selected_spa.get('NøgleKode', '')),
-            ("Styresystem",  selected_spa.get('Styresystem', '')),
-            ("Liter",        selected_spa.get('Liter', '')),
+            ("ObjektNummer", selected_spa['ObjektNummer']),
+            ("Model",        selected_spa['Model']),
+            ("NøgleKode",    selected_spa['NøgleKode']),
+            ("Styresystem",  selected_spa['Styresystem']),
+            ("Liter",        f"{selected_spa['Liter']:g}" if selected_spa['Liter'] is not None else None),
         ]
-        visible = [(label, val) for label, val in fields
-                   if val and val.lower() not in ("", "ikke angivet", "—")]
+        visible = [(label, val) for label, val in fields if val is not None]
 
         if visible:
             items_html = "".join(
@@ -617,36 +888,26 @@ else:  # ==================== SPA DEL ====================
                 unsafe_allow_html=True
             )
 
-        # Fyldning, Fyldes, Fyldetid og Tømning
-        fyldning = selected_spa.get('Fyldning', '')
-        fyldes   = selected_spa.get('Fyldes', '')
-        fyldetid = selected_spa.get('Fyldetid', '')
-        tomning  = selected_spa.get('Tømning', '')
-
-        import re as _re
+        # Fyldning, Fyldes, Fyldetid og Tømning (normaliseret ved indlæsning)
+        fyldning = selected_spa['Fyldning']
+        fyldes   = selected_spa['Fyldes']
+        fyldetid = selected_spa['Fyldetid']
+        tomning  = selected_spa['Tømning']
 
         # Byg info-bokse som én samlet flex-række uden mellemrum
         info_items = []
 
-        if fyldning and fyldning.lower() not in ("", "ikke angivet", "—"):
-            fyldning_ren = _re.sub(r'\s*(min\.?|minutter)\s*$', '', fyldning.strip(), flags=_re.IGNORECASE)
+        if fyldning is not None:
+            fyldning_tekst = f"{fyldning:g} minutter" if isinstance(fyldning, float) else fyldning
             info_items.append(
                 f'<div style="background:#f0f7ff; border-radius:8px; padding:0.7rem 1rem; flex:1; min-width:0;">'
                 f'<div style="color:#888; font-size:0.75rem;">Fyldning</div>'
-                f'<div style="font-size:0.95rem; font-weight:600;">💧 {fyldning_ren} minutter</div>'
+                f'<div style="font-size:0.95rem; font-weight:600;">💧 {fyldning_tekst}</div>'
                 f'</div>'
             )
 
-        if fyldes and fyldes.lower() not in ("", "ikke angivet", "—"):
-            fyldes_lower = fyldes.lower()
-            if "automatisk" in fyldes_lower:
-                fyldes_ikon, fyldes_farve = "🤖", "#f0fff4"
-            elif "kuglehane" in fyldes_lower or "semi" in fyldes_lower:
-                fyldes_ikon, fyldes_farve = "🔧", "#fff8f0"
-            elif "vandslange" in fyldes_lower:
-                fyldes_ikon, fyldes_farve = "🪣", "#f0f7ff"
-            else:
-                fyldes_ikon, fyldes_farve = "💧", "#f0f7ff"
+        if fyldes is not None:
+            fyldes_ikon, fyldes_farve = SPA_FYLDES_STYLE[selected_spa['Fyldes_type']]
             info_items.append(
                 f'<div style="background:{fyldes_farve}; border-radius:8px; padding:0.7rem 1rem; flex:1; min-width:0;">'
                 f'<div style="color:#888; font-size:0.75rem;">Fyldes</div>'
@@ -654,27 +915,17 @@ else:  # ==================== SPA DEL ====================
                 f'</div>'
             )
 
-        if fyldetid and fyldetid.lower() not in ("", "ikke angivet", "—"):
-            fyldetid_ren = _re.sub(r'\s*(min\.?|minutter)\s*$', '', fyldetid.strip(), flags=_re.IGNORECASE)
+        if fyldetid is not None:
+            fyldetid_tekst = f"{fyldetid:g} minutter" if isinstance(fyldetid, float) else fyldetid
             info_items.append(
                 f'<div style="background:#f0f7ff; border-radius:8px; padding:0.7rem 1rem; flex:1; min-width:0;">'
                 f'<div style="color:#888; font-size:0.75rem;">Fyldetid</div>'
-                f'<div style="font-size:0.95rem; font-weight:600;">⏱ {fyldetid_ren} minutter</div>'
+                f'<div style="font-size:0.95rem; font-weight:600;">⏱ {fyldetid_tekst}</div>'
                 f'</div>'
             )
 
-        if tomning and tomning.lower() not in ("", "ikke angivet", "—"):
-            tomning_lower = tomning.lower()
-            if "automatisk" in tomning_lower:
-                ikon, farve = "🤖", "#f0fff4"
-            elif "kuglehane" in tomning_lower or "semi" in tomning_lower:
-                ikon, farve = "🔧", "#fff8f0"
-            elif "dykpumpe" in tomning_lower or "manuel" in tomning_lower:
-                ikon, farve = "🪣", "#fff0f0"
-            elif "ikke" in tomning_lower or "tømmes ikke" in tomning_lower:
-                ikon, farve = "🚫", "#f5f5f5"
-            else:
-                ikon, farve = "🔽", "#f9f9f9"
+        if tomning is not None:
+            ikon, farve = SPA_TOMNING_STYLE[selected_spa['Tømning_type']]
             info_items.append(
                 f'<div style="background:{farve}; border-radius:8px; padding:0.7rem 1rem; flex:1; min-width:0;">'
                 f'<div style="color:#888; font-size:0.75rem;">Tømning</div>'
@@ -692,16 +943,14 @@ else:  # ==================== SPA DEL ====================
 
 
         # Link knap
-        link = selected_spa.get('Link', '')
-        if link and link.lower() != "ikke angivet" and link.strip():
+        link = selected_spa['Link']
+        if link:
             if st.button("🔗 Åbn Link / Manual", type="primary"):
                 st.markdown(f'<a href="{link}" target="_blank">Åbn link i ny fane</a>', unsafe_allow_html=True)
 
         # Billede(r)
-        billede = selected_spa.get('Billede', '')
-        if billede and billede.lower() not in ("", "ikke angivet", "—"):
-            import re
-            billede_links = [b.strip() for b in re.split(r'[,\n]+', billede) if b.strip()]
+        billede_links = selected_spa['Billede']
+        if billede_links:
             thumbs_html = "".join(
                 f'<a href="{b}" target="_blank">'
                 f'<img src="{b}" style="height:160px; width:auto; border-radius:8px; '
@@ -716,8 +965,8 @@ else:  # ==================== SPA DEL ====================
             )
 
         # Instruktioner (udfoldelig sektion)
-        instruktioner = selected_spa.get('Instruktioner', '')
-        if instruktioner and instruktioner.strip().lower() not in ("", "ikke angivet", "—"):
+        instruktioner = selected_spa['Instruktioner']
+        if instruktioner:
             with st.expander("➕ Se instruktioner for denne SPA"):
                 st.markdown(
                     f'<div style="font-size: 0.95rem; line-height: 1.6; white-space: pre-wrap;">{instruktioner}</div>',
@@ -762,54 +1011,42 @@ else:  # ==================== SPA DEL ====================
                 st.subheader("Anbefalet kemi ved afrejse")
                 st.markdown(f"**Målværdier ved afrejse:** pH = **{target_ph}** | Frit klor = **{target_cl} mg/l**")
 
-                try:
-                    spa_liter = float(selected_spa.get('Liter', '0').replace(',', '.'))
-                except (ValueError, AttributeError):
-                    spa_liter = 0.0
+                spa_liter = selected_spa['Liter'] or 0.0
+
+                spa_dose = spa_dosing(spa_liter, current_ph, current_cl)
 
                 # pH-justering
-                delta_ph = current_ph - target_ph
-                if delta_ph > 0.2:
-                    liter_ref = spa_liter if spa_liter > 0 else 1000.0
-                    ph_trin = delta_ph / 0.1
-                    spacare_ml = round(25 * ph_trin * (liter_ref / 1000))
-                    saniklar_g = round(15 * ph_trin * (liter_ref / 1000))
+                if spa_dose["ph_action"] == "minus":
                     st.error(
-                        f"**Sænk pH med {delta_ph:.1f} – vælg ét produkt:**\n\n"
-                        f"💧 **SpaCare pH Down Liquid:** ca. **{spacare_ml} ml**\n\n"
-                        f"🧂 **Saniklar pH-Minus (granulat):** ca. **{saniklar_g} gram**"
+                        f"**Sænk pH med {spa_dose['delta_ph']:.1f} – vælg ét produkt:**\n\n"
+                        f"💧 **SpaCare pH Down Liquid:** ca. **{spa_dose['spacare_ml']} ml**\n\n"
+                        f"🧂 **Saniklar pH-Minus (granulat):** ca. **{spa_dose['saniklar_g']} gram**"
                     )
-                elif delta_ph < -0.2:
-                    ml_ph_plus = round(25 * abs(delta_ph) * 1.5)
-                    st.error(f"**Brug pH-plus:** ca. **{ml_ph_plus} ml**")
+                elif spa_dose["ph_action"] == "plus":
+                    st.error(f"**Brug pH-plus:** ca. **{spa_dose['ph_plus_ml']} ml**")
                 else:
                     st.success("pH er inden for godt område")
 
                 # Klor-justering
-                delta_cl = current_cl - target_cl
-                if delta_cl < -0.5:
-                    if spa_liter > 0 and spa_liter > 1000:
-                        sunwac_antal = max(1, round(spa_liter / 1000))
-                        sunwac_navn = "SunWac 12"
-                    else:
-                        sunwac_antal = max(1, round((spa_liter if spa_liter > 0 else 500) / 500))
-                        sunwac_navn = "SunWac 9"
-
+                tab_twenty = spa_dose["tab_twenty"]
+                if spa_dose["cl_action"] == "raise":
                     st.error("**Hurtig opkloring (gæster samme dag):**")
-                    st.markdown(f"**{sunwac_navn} (Saniklar):** {sunwac_antal} stk")
+                    st.markdown(f"**{spa_dose['sunwac_name']} (Saniklar):** {spa_dose['sunwac_count']} stk")
 
-                    tab_twenty = max(2, round((spa_liter if spa_liter > 0 else 2500) / 2500) * 2)
                     st.error("**Langtids-klor (holder ca. 7 dage):**")
                     st.markdown(f"**Tab Twenty:** {tab_twenty} stk")
                     st.caption("Placer i floater eller klorinator for langsom frigivelse over 7 dage.")
 
-                elif delta_cl > 1.5:
+                elif spa_dose["cl_action"] == "high":
                     st.warning("**Klor for højt** – vent eller fortynd hvis muligt.")
                 else:
                     st.success(f"Klor-niveau er godt ({current_cl:.1f} mg/l)")
-                    tab_twenty = max(2, round((spa_liter if spa_liter > 0 else 2500) / 2500) * 2)
                     st.caption(f"Til vedligehold: Brug **{tab_twenty} Tab Twenty** til ca. 7 dages klor.")
 
+                if st.button("📝 Gem måling i historik"):
+                    add_measurement("spa", selected_spa['display_name'], current_ph, current_cl, True, tab_twenty)
+                    st.success("Målingen er gemt – den bruges til prognoser i Planlægning.")
+
             if service_mode == "Tømme + Fylde (skift af vand)":
                 st.markdown(
                     """
@@ -867,10 +1104,18 @@ else:  # ==================== SPA DEL ====================
 # ────────────────────────────────────────────────
 # Sidebar – skift type (log ud håndteres i login gate ovenfor)
 # ────────────────────────────────────────────────
+# Siden viser data mindst så nye som bussens version fra før katalogerne blev indlæst
+st.session_state["catalog_version"] = loaded_catalog_version
+
 with st.sidebar:
-    if st.button("🔄 Skift mellem Pool og SPA"):
+    catalog_change_notice(
+        [shard["name"] for shard in technician_shards],
+        {"pool": ["pools"], "spa": ["spas"]}.get(service_type, ["pools", "spas"]),
+    )
+    if st.button("🔄 Skift mellem Pool, SPA og Planlægning"):
         if "service_type" in st.session_state:
             del st.session_state.service_type
+        st.session_state.pop("current_object", None)
         st.rerun()
     st.divider()
     if st.button("🔒 Log ud"):
@@ -0,0 +1,47 @@
+# Copyright © 2026 FairPool v/Tommy Christensen, Laur Larsensgade 13, STTH, 4800 Nykøbing F.
+# E-mail: info@fairpool.dk
+# Denne app og dens underliggende kode/koncept er udviklet af FairPool v/Tommy Christensen.
+# Alle rettigheder forbeholdes FairPool v/Tommy Christensen.
+
+"""Starter FairPool med health-endpoint og forvarmning allerede ved processtart.
+
+Med `streamlit run pool_app.py` starter baggrundsjobbene først, når den første browser åbner
+appen. Bag en load balancer, der kun sender trafik til instanser hvis /health er klar, kommer
+den første session aldrig. Kør derfor i produktion:
+
+    python serve.py [streamlit-flag ...]      fx  python serve.py --server.port 8501
+
+Baggrundsjobbene ligger i fairpool_core, som pool_app.py også importerer. Modulet er det samme
+i hele processen, så scriptets egne kald til start_*/prewarm_caches rammer de jobs der
+allerede kører her.
+"""
+
+import sys
+import threading
+import time
+from pathlib import Path
+
+from streamlit.runtime import Runtime
+from streamlit.web import cli
+
+import fairpool_core
+
+APP_PATH = Path(__file__).with_name("pool_app.py").resolve()
+
+
+def start_background_jobs():
+    # Endpointet svarer 503 ("warming") med det samme, så load balanceren ikke ser en lukket port
+    fairpool_core.start_health_server()
+    # Caches skal oprettes i Streamlits runtime, så resten venter til serveren er startet
+    while not Runtime.exists():
+        time.sleep(0.1)
+    fairpool_core.start_memory_tracing()
+    fairpool_core.start_catalog_refresher()
+    fairpool_core.start_change_watcher()
+    fairpool_core.prewarm_caches()
+
+
+if __name__ == "__main__":
+    threading.Thread(target=start_background_jobs, name="fairpool-startup", daemon=True).start()
+    sys.argv = ["streamlit", "run", str(APP_PATH), *sys.argv[1:]]
+    sys.exit(cli.main())